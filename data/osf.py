@@ -4,6 +4,10 @@ data/osf.py
 
 Functions for fetching data from OSF.
 
+Importing this module downloads nothing: `data` fetches each file the first
+time it is accessed, e.g. data['accelerometer', 'Empatica E4'], through the
+persistent download cache (see utilities/fetch_data.py).
+
 Authors:
     - Jon Clucas, 2017  <jon.clucas@childmind.org>
 
@@ -17,12 +21,137 @@ hwa = (os.path.abspath(os.path.dirname(os.path.dirname(__file__))))
 if hwa not in sys.path:
     sys.path.append(hwa)
 
+from collections.abc import Mapping
 from config import config
 from utilities import fetch_data
+import threading
+
+
+class LazyData(Mapping):
+    """
+    Mapping of (sensor, device) to the local path of that device's data from
+    config.rawurls, fetching each file the first time it is accessed. Keys
+    and membership cover every file in config.rawurls, but values() and
+    items() only cover files fetched so far, so listing them never starts a
+    download; index with a key (or prefetch()) to fetch.
+
+    Attributes
+    ----------
+    paths : dictionary
+        local paths fetched so far by (sensor, device)
+    """
+    def __init__(self):
+        self.paths = {}
+        self.lock = threading.Lock()
+
+    def __getitem__(self, key):
+        """
+        Method to get the local path of a device's data, fetching it if this
+        is the first access.
+
+        Parameters
+        ----------
+        key : (string, string) tuple or string
+            (sensor, device), or a sensor for a {device: path} dictionary of
+            every device with that sensor (fetching each)
+
+        Returns
+        -------
+        path : string or dictionary
+            local path(s)
+        """
+        if isinstance(key, str):
+            return({device: self[key, device] for device in
+                   config.rawurls[key]})
+        sensor, device = key
+        url = config.rawurls[sensor][device]
+        with self.lock:
+            if key in self.paths:
+                return(self.paths[key])
+        path = fetch_data.fetch_data(url)
+        with self.lock:
+            self.paths[key] = path
+        return(path)
+
+    def __iter__(self):
+        return(iter([(sensor, device) for sensor, devices in
+               config.rawurls.items() for device in devices]))
+
+    def __len__(self):
+        return(sum(len(devices) for devices in config.rawurls.values()))
+
+    def __contains__(self, key):
+        if isinstance(key, str):
+            return(key in config.rawurls)
+        return(isinstance(key, tuple) and len(key) == 2 and key[0] in
+               config.rawurls and key[1] in config.rawurls[key[0]])
+
+    def items(self):
+        """
+        Method to list the files fetched so far, without fetching any others.
+
+        Returns
+        -------
+        items : list of ((string, string), string) tuples
+            ((sensor, device), local path) of each fetched file
+        """
+        with self.lock:
+            return(list(self.paths.items()))
+
+    def values(self):
+        """
+        Method to list the local paths of the files fetched so far, without
+        fetching any others.
+
+        Returns
+        -------
+        paths : list of strings
+            local path of each fetched file
+        """
+        with self.lock:
+            return(list(self.paths.values()))
+
+    def prefetch(self, sensors=None, devices=None, background=True,
+                 max_workers=8):
+        """
+        Method to fetch a selection of files ahead of access (see
+        fetch_data.prefetch()).
+
+        Parameters
+        ----------
+        sensors : string or list of strings or None
+            sensor(s) to fetch (default=None, i.e. all sensors)
+
+        devices : list of strings or None
+            devices to fetch (default=None, i.e. all devices)
+
+        background : boolean
+            return at once and fetch in a daemon thread (default=True);
+            accessing a file that is still downloading waits for it
+
+        max_workers : int
+            most downloads at once (default=8)
+
+        Returns
+        -------
+        thread : threading.Thread or None
+            the background thread, or None if not `background`
+        """
+        def run():
+            fetched = fetch_data.prefetch(sensors, devices, max_workers,
+                      ignore_errors=True)
+            with self.lock:
+                for sensor, paths in fetched.items():
+                    for device, path in paths.items():
+                        if path:
+                            self.paths[sensor, device] = path
+        if not background:
+            run()
+            return(None)
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return(thread)
+
 
-data = dict()
 urls = config.raw_urls()
-for sensor, device in urls.items():
-    for device, url in device.items():
-        data[sensor] = {device:None}
-        data[sensor][device] = fetch_data.fetch_data(url)
\ No newline at end of file
+data = LazyData()
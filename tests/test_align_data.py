@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_align_data.py
+
+Tests for choosing the resampling method by sensor in
+utilities/align_data.py.
+
+@author: jon.clucas
+"""
+from utilities.align_data import grid_devices, resample_device
+import pandas as pd
+
+def frame(column, times, values):
+    return(pd.DataFrame({column: values}, index=pd.Index(pd.to_datetime(
+           times), name='Timestamp')))
+
+times = ['2017-04-07 17:27:00.0', '2017-04-07 17:27:00.5',
+         '2017-04-07 17:27:02.0']
+
+def test_resample_device_sensor():
+    df = frame('temperature', times, [20.0, 20.0, 22.0])
+    # temperature is interpolated linearly...
+    linear = resample_device(df, '1s', sensor='temperature')
+    assert list(linear['temperature'].round(3)) == [20.0, 20.667, 22.0]
+    # ...unless a method is given, and other sensors are averaged per bin
+    assert list(resample_device(df, '1s', 'max', 'temperature')[
+                'temperature']) == [20.0, 22.0]
+    assert list(resample_device(df, '1s')['temperature']) == [20.0, 22.0]
+    assert list(resample_device(df, '1s', sensor='accelerometer')[
+                'temperature']) == [20.0, 22.0]
+
+def test_grid_devices_sensors():
+    df = grid_devices([frame('x', times, [0.0, 1.0, 2.0]), frame(
+                      'temperature', times, [20.0, 20.0, 22.0])], '1s',
+                      sensors=['accelerometer', 'temperature'])
+    assert list(df.index) == [pd.Timestamp('2017-04-07 17:27:00'),
+                              pd.Timestamp('2017-04-07 17:27:02')]
+    assert list(df['x']) == [0.5, 2.0]
+    assert list(df['temperature']) == [20.0, 22.0]
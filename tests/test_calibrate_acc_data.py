@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_calibrate_acc_data.py
+
+Tests for where utilities/calibrate_acc_data.calibrate_bin() caches the
+coefficients of fixtures/two_pages.bin, which has too little non-movement
+data to calibrate and so gets the identity coefficients.
+
+@author: jon.clucas
+"""
+from utilities.calibrate_acc_data import calibrate_bin, \
+     calibration_cache_file
+import os, shutil
+bin_file = os.path.join(os.path.dirname(__file__), 'fixtures',
+           'two_pages.bin')
+
+def test_calibrate_bin_cache_dir(tmp_path):
+    coefficients = calibrate_bin(bin_file, cache_dir=str(tmp_path))
+    assert not coefficients['calibrated']
+    assert coefficients['scale'] == [1.0, 1.0, 1.0]
+    cache_file = calibration_cache_file(bin_file, str(tmp_path))
+    assert os.path.dirname(cache_file) == str(tmp_path)
+    assert os.path.exists(cache_file)
+    assert not os.path.exists('.'.join([bin_file, 'calibration', 'json']))
+    assert calibrate_bin(bin_file, cache_dir=str(tmp_path)) == coefficients
+
+def test_calibrate_bin_unwritable_cache(tmp_path):
+    local_bin = str(tmp_path / 'GA_black.bin')
+    shutil.copy(bin_file, local_bin)
+    missing = str(tmp_path / 'missing' / 'cache')
+    coefficients = calibrate_bin(local_bin, cache_dir=missing)
+    assert coefficients['scale'] == [1.0, 1.0, 1.0]
+    assert not os.path.exists(missing)
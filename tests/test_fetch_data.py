@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_fetch_data.py
+
+Tests for utilities/fetch_data.download_file(), the download cache and the
+stores built from it, against a local HTTP server that can drop connections
+part way through a response, ignore Range requests, honour If-Range, answer
+416, stall and leave out Content-Length.
+
+@author: jon.clucas
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from config import config
+from utilities import fetch_data
+from utilities.fetch_data import cache_object, cached_fetch, download_file, \
+     evict_cache, fetch_store, load_cache_index, new_hash
+from utilities.store_data import load_store
+import json, os, pytest, threading, time, urllib.error
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """
+    Handler serving `server.contents`[path] or else `server.content`,
+    sending at most `server.drop_after` bytes of each response before
+    closing the connection, or stalling for `server.stall` seconds after the
+    first 1000 bytes of the next response.
+    """
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        content = server.contents.get(self.path, server.content)
+        start = 0
+        requested = self.headers.get('Range')
+        if requested and server.ranges and self.headers.get('If-Range') in [
+           None, server.etag]:
+            start = int(requested.split('=')[1].split('-')[0])
+            if start >= len(content):
+                self.send_response(416)
+                self.send_header('Content-Range', 'bytes */{0}'.format(len(
+                                 content)))
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {0}-{1}/{2}'.format(
+                             start, len(content) - 1, len(content)))
+        else:
+            self.send_response(200)
+        if server.etag:
+            self.send_header('ETag', server.etag)
+        if server.send_length:
+            self.send_header('Content-Length', str(len(content) - start))
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        body = content[start:]
+        if server.stall:
+            stall, server.stall = server.stall, 0
+            self.wfile.write(body[:1000])
+            self.wfile.flush()
+            time.sleep(stall)
+            self.close_connection = True
+            return
+        self.wfile.write(body[:server.drop_after] if server.drop_after else
+                         body)
+        self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FlakyHandler)
+    server.content = bytes(range(256)) * 1000
+    server.contents = {}
+    server.etag = '"v1"'
+    server.ranges = True
+    server.send_length = True
+    server.drop_after = None
+    server.stall = 0
+    server.requests = []
+    server.url = 'http://127.0.0.1:{0}/data.bin'.format(server.server_port)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield(server)
+    server.shutdown()
+    server.server_close()
+
+def digest(content):
+    h = new_hash('sha256')
+    h.update(content)
+    return(h.hexdigest())
+
+def check_download(server, output_file):
+    with open(output_file, 'rb') as fp:
+        assert fp.read() == server.content
+    assert not os.path.exists(output_file + '.part')
+    assert not os.path.exists(output_file + '.part.json')
+
+def test_resume_206(server, tmp_path):
+    server.drop_after = 70000
+    output_file = str(tmp_path / 'data.bin')
+    assert download_file(server.url, output_file, 'sha256', backoff=0) == \
+           digest(server.content)
+    check_download(server, output_file)
+    assert len(server.requests) == 4
+    assert 'Range' not in server.requests[0]
+    assert [r['Range'] for r in server.requests[1:]] == ['bytes=70000-',
+           'bytes=140000-', 'bytes=210000-']
+    assert all(r['If-Range'] == '"v1"' for r in server.requests[1:])
+
+def test_restart_200(server, tmp_path):
+    server.drop_after = 70000
+    server.ranges = False
+    output_file = str(tmp_path / 'data.bin')
+    with pytest.raises(Exception):
+        download_file(server.url, output_file, 'sha256', retries=0,
+                      backoff=0)
+    assert os.path.getsize(output_file + '.part') == 70000
+    server.drop_after = None
+    assert download_file(server.url, output_file, 'sha256', backoff=0) == \
+           digest(server.content)
+    check_download(server, output_file)
+    assert server.requests[-1]['Range'] == 'bytes=70000-'
+
+def test_if_range_changed(server, tmp_path):
+    server.drop_after = 70000
+    output_file = str(tmp_path / 'data.bin')
+    with pytest.raises(Exception):
+        download_file(server.url, output_file, 'sha256', retries=0,
+                      backoff=0)
+    server.content = bytes(reversed(server.content))
+    server.etag = '"v2"'
+    server.drop_after = None
+    assert download_file(server.url, output_file, 'sha256', backoff=0) == \
+           digest(server.content)
+    check_download(server, output_file)
+
+def test_range_not_satisfiable(server, tmp_path):
+    output_file = str(tmp_path / 'data.bin')
+    server.etag = None
+    server.content = server.content[:5000]
+    with open(output_file + '.part', 'wb') as fp:
+        fp.write(b'\0' * 8000)
+    with open(output_file + '.part.json', 'w') as fp:
+        json.dump({'url': server.url, 'etag': None, 'last_modified': None,
+                  'length': 10000}, fp)
+    assert download_file(server.url, output_file, 'sha256', backoff=0) == \
+           digest(server.content)
+    check_download(server, output_file)
+    assert server.requests[0]['Range'] == 'bytes=8000-'
+    assert 'Range' not in server.requests[1]
+
+def test_range_not_satisfiable_no_retries(server, tmp_path):
+    output_file = str(tmp_path / 'data.bin')
+    server.content = server.content[:5000]
+    with open(output_file + '.part', 'wb') as fp:
+        fp.write(b'\0' * 8000)
+    with open(output_file + '.part.json', 'w') as fp:
+        json.dump({'url': server.url, 'etag': None, 'last_modified': None,
+                  'length': 10000}, fp)
+    with pytest.raises(urllib.error.HTTPError):
+        download_file(server.url, output_file, 'sha256', retries=0,
+                      backoff=0)
+
+def test_no_content_length(server, tmp_path):
+    server.send_length = False
+    output_file = str(tmp_path / 'data.bin')
+    assert download_file(server.url, output_file, 'sha256', backoff=0) == \
+           digest(server.content)
+    check_download(server, output_file)
+    assert len(server.requests) == 1
+
+def test_resume_stall(server, tmp_path):
+    server.stall = 5
+    output_file = str(tmp_path / 'data.bin')
+    start = time.time()
+    assert download_file(server.url, output_file, 'sha256', timeout=0.5,
+                         backoff=0) == digest(server.content)
+    assert time.time() - start < 4
+    check_download(server, output_file)
+    # the stalled block is read again, so both requests start from 0
+    assert len(server.requests) == 2
+
+def test_resume_backoff(server, tmp_path, monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(fetch_data.time, 'sleep', sleeps.append)
+    server.drop_after = 70000
+    output_file = str(tmp_path / 'data.bin')
+    assert download_file(server.url, output_file, 'sha256', backoff=0.5) == \
+           digest(server.content)
+    assert sleeps == [0.5, 1.0, 2.0]
+
+def test_fetch_store(server, tmp_path, monkeypatch):
+    server.content = '\n'.join(['Timestamp,x'] + ['2017-04-07 17:27:0{0},{0}'
+                     .format(i) for i in range(10)] + ['']).encode('utf-8')
+    monkeypatch.setitem(config.rawurls, 'accelerometer', {'Test':
+                        server.url})
+    # a read-only working directory must not matter
+    monkeypatch.chdir('/')
+    cache_dir = str(tmp_path)
+    store_dir = fetch_store('accelerometer', 'Test', cache_dir)
+    assert os.path.dirname(store_dir) == os.path.join(cache_dir, 'objects')
+    df = load_store(store_dir, '2017-04-07 17:27:02', '2017-04-07 17:27:04')
+    assert list(df['x']) == [2, 3, 4]
+    assert fetch_store('accelerometer', 'Test', cache_dir) == store_dir
+    assert len(server.requests) == 1
+    index = load_cache_index(cache_dir)
+    evict_cache(cache_dir, index, 0)
+    assert not os.path.exists(store_dir)
+
+def test_cache_hit(server, tmp_path):
+    data_path = cached_fetch(server.url, cache_dir=str(tmp_path))
+    with open(data_path, 'rb') as fp:
+        assert fp.read() == server.content
+    assert cached_fetch(server.url, cache_dir=str(tmp_path)) == data_path
+    assert cached_fetch(server.url, digest(server.content), 'sha256',
+                        str(tmp_path), offline_mode=True) == data_path
+    assert len(server.requests) == 1
+
+def test_cache_offline_miss(server, tmp_path):
+    with pytest.raises(IOError):
+        cached_fetch(server.url, cache_dir=str(tmp_path), offline_mode=True)
+    assert not server.requests
+
+def test_cache_eviction(server, tmp_path):
+    urls = [server.url.replace('data.bin', name) for name in ['a', 'b', 'c']]
+    for i, name in enumerate(['a', 'b', 'c']):
+        server.contents['/' + name] = bytes([i]) * 1000
+    paths = [cached_fetch(url, cache_dir=str(tmp_path), limit=2500) for url
+             in urls]
+    assert not os.path.exists(paths[0])
+    assert os.path.exists(paths[1]) and os.path.exists(paths[2])
+    assert sorted(load_cache_index(str(tmp_path))) == sorted(urls[1:])
+    # a limit below a single file still keeps the newest one
+    newest = cached_fetch(server.url, cache_dir=str(tmp_path), limit=1)
+    assert os.listdir(os.path.join(str(tmp_path), 'objects')) == [
+           os.path.basename(newest)]
+    assert list(load_cache_index(str(tmp_path))) == [server.url]
+
+def test_cache_hash_mismatch(server, tmp_path):
+    with pytest.raises(IOError):
+        cached_fetch(server.url, '0' * 64, 'sha256', str(tmp_path))
+    assert not os.listdir(os.path.join(str(tmp_path), 'objects'))
+    assert server.url not in load_cache_index(str(tmp_path))
+    assert not os.path.exists(cache_object(str(tmp_path), digest(
+           server.content)))
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_organize_wearable_data.py
+
+Tests for ingesting a directory of GENEActiv files through
+utilities/organize_wearable_data.geneactiv_acc() and geneactiv_1c(), with a
+raw .bin file (fixtures/two_pages.bin, see test_read_geneactiv_bin.py) and a
+GENEAread csv export of a different recording side by side.
+
+@author: jon.clucas
+"""
+from utilities.organize_wearable_data import geneactiv_1c, geneactiv_acc
+import os, pandas as pd, pytest, shutil
+fixtures = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+@pytest.fixture
+def raw_dir(tmp_path, monkeypatch):
+    raw = tmp_path / 'raw'
+    raw.mkdir()
+    shutil.copy(os.path.join(fixtures, 'two_pages.bin'), str(raw /
+                'GA_black.bin'))
+    rows = ['header,{0}'.format(i) for i in range(100)]
+    times = pd.date_range('2017-04-08 09:00:00', periods=50, freq='10ms')
+    rows += ['{0},4,0,-4,12,0,21.5'.format(t.strftime(
+             '%Y-%m-%d %H:%M:%S:%f')[:-3]) for t in times]
+    (raw / 'GA_black.csv').write_text('\n'.join(rows) + '\n')
+    work = tmp_path / 'work'
+    work.mkdir()
+    monkeypatch.chdir(str(work))
+    return(str(raw))
+
+def test_geneactiv_acc_csv(raw_dir):
+    black, pink = geneactiv_acc(raw_dir)
+    assert len(black) == 50
+    assert black.index[0] == pd.Timestamp('2017-04-08 09:00:00')
+    # csv exports are in 1/8g
+    assert list(black.iloc[0]) == [1.0, 0.0, -1.0]
+    assert len(pink) == 0
+
+def test_geneactiv_acc_bin(raw_dir):
+    black, pink = geneactiv_acc(raw_dir, source='bin')
+    assert len(black) == 600
+    assert black.index[0] == pd.Timestamp('2017-04-07 17:27:05.500')
+    assert black.index.is_unique
+    assert list(black.iloc[0]) == [1.0, 0.0, 1.0]
+    assert len(pink) == 0
+
+def test_geneactiv_1c_bin(raw_dir):
+    black, pink = geneactiv_1c(raw_dir, 6, source='bin')
+    assert list(black.columns) == ['temperature']
+    assert len(black) == 600
+    assert list(black['temperature'].iloc[[0, -1]]) == [25.5, 26.0]
+
+def test_geneactiv_acc_source(raw_dir):
+    with pytest.raises(ValueError):
+        geneactiv_acc(raw_dir, source='both')
+
+def test_geneactiv_acc_bin_calibration_cache(raw_dir):
+    geneactiv_acc(raw_dir, source='bin')
+    assert not [f for f in os.listdir(raw_dir) if f.endswith('.json')]
+    cached = os.listdir(os.path.join(os.path.dirname(raw_dir), 'organized',
+             'calibration'))
+    assert len(cached) == 1
+    assert cached[0].startswith('GA_black.bin.')
+
+def test_geneactiv_acc_bin_recalibrated(raw_dir):
+    os.rename(os.path.join(raw_dir, 'GA_black.bin'), os.path.join(raw_dir,
+              'GA_black_Recalibrate.bin'))
+    black, pink = geneactiv_acc(raw_dir, source='bin')
+    assert len(black) == 600
+    # GGIR output is not calibrated again, so nothing is fitted or cached
+    assert not os.path.exists(os.path.join(os.path.dirname(raw_dir),
+           'organized', 'calibration'))
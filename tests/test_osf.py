@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_osf.py
+
+Tests for data/osf.LazyData: membership matches indexing, and listing
+values or items never fetches anything.
+
+@author: jon.clucas
+"""
+from config import config
+from data.osf import LazyData
+from utilities import fetch_data
+import pytest
+
+@pytest.fixture
+def fetched(monkeypatch):
+    urls = []
+    monkeypatch.setattr(config, 'rawurls', {'accelerometer': {'A': 'url-a',
+                        'B': 'url-b'}, 'light': {'A': 'url-c'}})
+    monkeypatch.setattr(fetch_data, 'fetch_data', lambda url: urls.append(
+                        url) or '/cache/' + url)
+    return(urls)
+
+def test_contains(fetched):
+    data = LazyData()
+    assert 'accelerometer' in data
+    assert ('accelerometer', 'B') in data
+    assert 'temperature' not in data
+    assert ('light', 'B') not in data
+    assert len(data) == 3
+    assert not fetched
+
+def test_values_items(fetched):
+    data = LazyData()
+    assert data.values() == [] and data.items() == []
+    assert not fetched
+    assert data['accelerometer', 'A'] == '/cache/url-a'
+    assert data['accelerometer', 'A'] == '/cache/url-a'
+    assert data.items() == [(('accelerometer', 'A'), '/cache/url-a')]
+    assert data.values() == ['/cache/url-a']
+    assert data['light'] == {'A': '/cache/url-c'}
+    assert fetched == ['url-a', 'url-c']
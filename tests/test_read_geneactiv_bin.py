@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+test_read_geneactiv_bin.py
+
+Tests for utilities/read_geneactiv_bin.py against fixtures/two_pages.bin, a
+two-page 100 Hz file with x gain 25600, y offset -25600, z gain 204700, lux
+400 and volts 300. Every sample is 0 except the first sample of page 0 (raw
+x 256, y -256, z 2047, light 1023, button 1) and the last sample of page 1
+(raw x -2048, y 128, z -1, light 3, button 0).
+
+@author: jon.clucas
+"""
+from utilities.read_geneactiv_bin import read_bin
+import numpy as np, os, pandas as pd
+bin_file = os.path.join(os.path.dirname(__file__), 'fixtures',
+           'two_pages.bin')
+
+def test_read_bin_values():
+    df = read_bin(bin_file)
+    assert list(df.columns) == ['x', 'y', 'z', 'light', 'button',
+                                'temperature']
+    assert len(df) == 600
+    first = df.iloc[0]
+    assert (first['x'], first['y'], first['z']) == (1.0, 0.0, 1.0)
+    assert (first['light'], first['button']) == (1364.0, 1)
+    last = df.iloc[-1]
+    assert (last['x'], last['y']) == (-8.0, 1.5)
+    assert np.isclose(last['z'], -100 / 204700)
+    assert (last['light'], last['button']) == (4.0, 0)
+    # zero raw y is 1 g after the -25600 offset
+    assert (df['y'].iloc[1:-1] == 1.0).all()
+    assert (df['button'].iloc[1:] == 0).all()
+
+def test_read_bin_timestamps():
+    df = read_bin(bin_file)
+    assert df.index[0] == pd.Timestamp('2017-04-07 17:27:05.500')
+    assert df.index[299] == pd.Timestamp('2017-04-07 17:27:08.490')
+    assert df.index[300] == pd.Timestamp('2017-04-07 17:27:08.500')
+    assert df.index[-1] == pd.Timestamp('2017-04-07 17:27:11.490')
+    assert (np.diff(df.index.values).astype(np.int64) == 10000000).all()
+    assert list(df['temperature'].iloc[[0, 299, 300, 599]]) == [25.5, 25.5,
+                                                                26.0, 26.0]
+
+def test_read_bin_chunks():
+    chunks = list(read_bin(bin_file, pages_per_chunk=1))
+    assert [len(chunk) for chunk in chunks] == [300, 300]
+    pd.testing.assert_frame_equal(pd.concat(chunks), read_bin(bin_file))
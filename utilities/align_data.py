@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+align_data.py
+
+Functions to align organized data from multiple wearable devices with
+Linux time-series indices onto a shared set of timestamps, and to resample
+devices recorded at different rates onto a common time grid.
+
+@author: jon.clucas
+"""
+from datetime import timedelta
+import numpy as np, pandas as pd
+
+# clock corrections by device, added to each device's timestamps before
+# alignment
+device_offsets = {'ActiGraph wGT3X-BT': timedelta(microseconds=-1000)}
+# resampling method by sensor, the default when resampling a sensor's data
+sensor_methods = {'accelerometer': 'mean', 'photoplethysmograph': 'mean',
+                  'electrodermal activity': 'mean', 'EDA': 'mean',
+                  'electrocardiography': 'nearest', 'heartrate': 'nearest',
+                  'light': 'mean', 'temperature': 'linear'}
+
+def main():
+    pass
+
+def align_devices(frames, offsets=None, tolerance=None, how='inner'):
+    """
+    Function to align dataframes from several devices in a single pass. Each
+    device's timestamps are shifted by its offset as one vectorized addition,
+    then matched to the nearest timestamp of the first (reference) dataframe
+    by binary search, so aligning k devices costs one sort-merge per device
+    instead of a chain of copying merges.
+
+    Parameters
+    ----------
+    frames : list of pandas dataframes
+        dataframes with Linux time-series indices; column names must not
+        repeat across dataframes
+
+    offsets : list of timedelta-likes or None
+        offset to add to each dataframe's timestamps, None for no offset
+        (default=None, i.e. no offsets)
+
+    tolerance : timedelta-like or None
+        largest difference between matched timestamps (default=None, i.e.
+        exact matches only, like an index merge)
+
+    how : string
+        'inner' to keep only reference timestamps matched in every dataframe,
+        'left' to keep every reference timestamp with NaN for unmatched
+        devices (default='inner')
+
+    Returns
+    -------
+    df : pandas dataframe
+        dataframe indexed by the (shifted) reference timestamps with the
+        columns of every dataframe
+    """
+    offsets = offsets if offsets else [None] * len(frames)
+    tolerance_ns = np.int64(pd.Timedelta(tolerance).value) if tolerance is not \
+                   None else np.int64(0)
+    indices = [shifted_ns(frame.index, offset) for frame, offset in zip(frames,
+               offsets)]
+    reference_order = np.argsort(indices[0], kind='mergesort')
+    reference = indices[0][reference_order]
+    keep = np.ones(len(reference), dtype=bool)
+    aligned = []
+    for i, (frame, index) in enumerate(zip(frames, indices)):
+        if i == 0:
+            rows = frame.iloc[reference_order]
+            matched = keep.copy()
+        else:
+            order = np.argsort(index, kind='mergesort')
+            rows, matched = nearest_rows(frame.iloc[order], index[order],
+                            reference, tolerance_ns)
+        rows.index = pd.Index(reference.view('datetime64[ns]'), name=
+                     'Timestamp')
+        if how == 'left' and not matched.all():
+            rows = rows.where(pd.Series(matched, index=rows.index), axis=0)
+        keep &= matched
+        aligned.append(rows)
+    df = pd.concat(aligned, axis=1)
+    return(df[keep] if how == 'inner' else df)
+
+def nearest_rows(frame, index, reference, tolerance_ns):
+    """
+    Function to take, for each reference timestamp, the row of a dataframe
+    with the nearest timestamp.
+
+    Parameters
+    ----------
+    frame : pandas dataframe
+        dataframe sorted by time
+
+    index : numpy array
+        int64 nanosecond timestamps of `frame`, sorted
+
+    reference : numpy array
+        int64 nanosecond reference timestamps, sorted
+
+    tolerance_ns : int
+        largest difference between matched timestamps in nanoseconds
+
+    Returns
+    -------
+    rows : pandas dataframe
+        one row of `frame` per reference timestamp
+
+    matched : numpy array
+        boolean array, True where the nearest row is within `tolerance_ns`
+    """
+    if not len(index):
+        rows = pd.DataFrame(np.nan, index=np.arange(len(reference)), columns=
+               frame.columns)
+        return(rows, np.zeros(len(reference), dtype=bool))
+    position = np.searchsorted(index, reference)
+    before = np.clip(position - 1, 0, len(index) - 1)
+    after = np.clip(position, 0, len(index) - 1)
+    nearest = np.where(np.abs(reference - index[before]) <= np.abs(index[
+              after] - reference), before, after)
+    matched = np.abs(index[nearest] - reference) <= tolerance_ns
+    return(frame.iloc[nearest], matched)
+
+def grid_devices(frames, period, methods=None, offsets=None, sensors=None):
+    """
+    Function to resample dataframes from devices with different sampling
+    rates onto one shared time grid and align them.
+
+    Parameters
+    ----------
+    frames : list of pandas dataframes
+        dataframes with Linux time-series indices; column names must not
+        repeat across dataframes
+
+    period : timedelta-like
+        grid spacing (e.g. '1s')
+
+    methods : string or list of strings or None
+        resampling method for all dataframes or for each (see
+        resample_chunks(); default=None, i.e. by sensor)
+
+    offsets : list of timedelta-likes or None
+        offset to add to each dataframe's timestamps before resampling
+        (default=None)
+
+    sensors : string or list of strings or None
+        sensor of all dataframes or of each, choosing the method from
+        `sensor_methods` where `methods` doesn't (default=None, i.e. 'mean')
+
+    Returns
+    -------
+    df : pandas dataframe
+        dataframe indexed by grid timestamps covered by every device
+    """
+    methods = [methods] * len(frames) if isinstance(methods, str) or methods \
+              is None else methods
+    sensors = [sensors] * len(frames) if isinstance(sensors, str) or sensors \
+              is None else sensors
+    offsets = offsets if offsets else [None] * len(frames)
+    gridded = []
+    for frame, method, offset, sensor in zip(frames, methods, offsets,
+                                             sensors):
+        if offset:
+            frame = frame.set_axis(pd.Index(shifted_ns(frame.index,
+                    offset).view('datetime64[ns]'), name=frame.index.name),
+                    axis=0)
+        gridded.append(resample_device(frame, period, method, sensor))
+    return(align_devices(gridded))
+
+def resample_device(df, period, method=None, sensor=None):
+    """
+    Function to resample one organized device dataframe onto a time grid.
+
+    Parameters
+    ----------
+    df : pandas dataframe
+        dataframe with Linux time-series index
+
+    period : timedelta-like
+        grid spacing (e.g. '1s')
+
+    method : string or None
+        see resample_chunks() (default=None, i.e. by sensor)
+
+    sensor : string or None
+        sensor the data are from (default=None)
+
+    Returns
+    -------
+    df : pandas dataframe
+        resampled dataframe
+    """
+    parts = list(resample_chunks([df], period, method, sensor))
+    if not parts:
+        return(df.iloc[:0])
+    return(pd.concat(parts))
+
+def resample_chunks(chunks, period, method=None, sensor=None):
+    """
+    Generator to resample streamed chunks of one device's organized data
+    onto a time grid of multiples of `period` since the Linux epoch, so every
+    device resampled with the same period shares the same grid. Only one grid
+    step of data is carried between chunks, so weeks of data can be gridded
+    in bounded memory.
+
+    Parameters
+    ----------
+    chunks : iterable of pandas dataframes
+        dataframes with Linux time-series index and numeric columns, in time
+        order
+
+    period : timedelta-like
+        grid spacing (e.g. '1s')
+
+    method : string or None
+        'mean', 'max', 'min', 'median', 'sum', 'first', 'last' or 'count' to
+        aggregate the samples in each [t, t + period) bin; 'linear' to
+        interpolate, or 'nearest' to take the nearest sample, at each grid
+        time between the first and last samples (default=None, i.e.
+        `sensor_methods`[`sensor`], or 'mean' for other sensors)
+
+    sensor : string or None
+        sensor the data are from, e.g. 'temperature' (default=None)
+
+    Yields
+    ------
+    df : pandas dataframe
+        resampled dataframe indexed by grid timestamps
+    """
+    method = method if method else sensor_methods.get(sensor, 'mean')
+    period_ns = np.int64(pd.Timedelta(period).value)
+    carry = None
+    emitted = None
+    for chunk in chunks:
+        if not len(chunk):
+            continue
+        if carry is not None:
+            chunk = pd.concat([carry, chunk])
+        ns = shifted_ns(chunk.index)
+        if method in ['linear', 'nearest']:
+            carry = chunk.iloc[-1:]
+            start = -(-ns[0] // period_ns) if emitted is None else emitted + 1
+            stop = ns[-1] // period_ns
+            if stop < start:
+                continue
+            emitted = stop
+            yield(interpolate_grid(chunk, ns, np.arange(start, stop + 1) *
+                  period_ns, method))
+        else:
+            bins = ns // period_ns
+            complete = bins < bins[-1]
+            carry = chunk[~complete]
+            if complete.any():
+                yield(aggregate_grid(chunk[complete], bins[complete],
+                      period_ns, method))
+    if carry is not None and method not in ['linear', 'nearest']:
+        yield(aggregate_grid(carry, shifted_ns(carry.index) // period_ns,
+              period_ns, method))
+
+def aggregate_grid(df, bins, period_ns, method):
+    """
+    Function to aggregate samples into consecutive grid bins, with NaN for
+    empty bins.
+
+    Parameters
+    ----------
+    df : pandas dataframe
+        samples
+
+    bins : numpy array
+        grid bin number of each sample
+
+    period_ns : int
+        grid spacing in nanoseconds
+
+    method : string
+        pandas groupby aggregation (e.g. 'mean', 'max')
+
+    Returns
+    -------
+    df : pandas dataframe
+        aggregated dataframe indexed by bin start timestamps
+    """
+    aggregated = getattr(df.groupby(bins), method)()
+    aggregated = aggregated.reindex(np.arange(bins[0], bins[-1] + 1))
+    aggregated.index = pd.Index((aggregated.index.values.astype(np.int64) *
+                       period_ns).view('datetime64[ns]'), name='Timestamp')
+    return(aggregated)
+
+def interpolate_grid(df, ns, grid, method):
+    """
+    Function to interpolate samples at grid timestamps.
+
+    Parameters
+    ----------
+    df : pandas dataframe
+        samples
+
+    ns : numpy array
+        int64 nanosecond timestamps of `df`, sorted
+
+    grid : numpy array
+        int64 nanosecond grid timestamps within the range of `ns`
+
+    method : string
+        'linear' or 'nearest'
+
+    Returns
+    -------
+    df : pandas dataframe
+        interpolated dataframe indexed by grid timestamps
+    """
+    index = pd.Index(grid.view('datetime64[ns]'), name='Timestamp')
+    if method == 'nearest':
+        position = np.searchsorted(ns, grid)
+        before = np.clip(position - 1, 0, len(ns) - 1)
+        after = np.clip(position, 0, len(ns) - 1)
+        nearest = np.where(grid - ns[before] <= ns[after] - grid, before,
+                  after)
+        return(df.iloc[nearest].set_axis(index, axis=0))
+    x = (ns - ns[0]).astype(np.float64)
+    xi = (grid - ns[0]).astype(np.float64)
+    return(pd.DataFrame({c: np.interp(xi, x, df[c].values.astype(
+           np.float64)) for c in df.columns}, index=index))
+
+def shifted_ns(index, offset=None):
+    """
+    Function to convert a time-series index to int64 nanoseconds, shifted by
+    an offset.
+
+    Parameters
+    ----------
+    index : pandas index
+        Linux time-series index
+
+    offset : timedelta-like or None
+        offset to add (default=None)
+
+    Returns
+    -------
+    ns : numpy array
+        int64 nanosecond timestamps
+    """
+    ns = pd.DatetimeIndex(index).values.astype('datetime64[ns]').view(
+         np.int64)
+    return(ns + np.int64(pd.Timedelta(offset).value) if offset else ns)
+
+# ============================================================================
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+calibrate_acc_data.py
+
+Functions to autocalibrate raw accelerometry data against local gravity, as
+GGIR's g.calibrate does for JonClucasCalibrationScript.R, without an R
+runtime or rewriting the source file.
+
+Non-movement windows (standard deviation < 0.013g on every axis) should have
+a vector length of 1g. Offset, scale and temperature coefficients per axis
+are fit to the window means by iteratively reweighted least squares towards
+the closest points on the unit sphere, and applied as
+(x + offset) × scale + (temperature - mean temperature) × temperature offset.
+
+@author: jon.clucas
+"""
+from utilities.read_geneactiv_bin import read_bin
+import hashlib, json, numpy as np, os, pandas as pd
+axes = ['x', 'y', 'z']
+
+def main():
+    pass
+
+def nonmovement_windows(chunks, window_seconds=10, sd_criterion=0.013,
+                        mean_criterion=2):
+    """
+    Function to find non-movement windows in streamed accelerometry data and
+    return their mean values. Only one window's worth of data is carried
+    between chunks.
+
+    Parameters
+    ----------
+    chunks : iterable of pandas dataframes
+        dataframes with Linux time-series index and x, y, z (g) and
+        temperature columns, in time order
+
+    window_seconds : numeric
+        window length in seconds (default=10, as GGIR)
+
+    sd_criterion : float
+        maximum standard deviation on each axis (default=0.013)
+
+    mean_criterion : float
+        maximum absolute mean on each axis (default=2)
+
+    Returns
+    -------
+    windows : pandas dataframe
+        x, y, z and temperature means of each non-movement window
+    """
+    window_ns = int(window_seconds * 1e9)
+    columns = axes + ['temperature']
+    windows = []
+    carry = None
+    for chunk in chunks:
+        chunk = chunk[columns] if carry is None else pd.concat([carry, chunk[
+                columns]])
+        if chunk.empty:
+            continue
+        window = pd.DatetimeIndex(chunk.index).values.astype(
+                 'datetime64[ns]').view(np.int64) // window_ns
+        complete = window < window[-1]
+        carry = chunk[~complete]
+        windows.append(window_means(chunk[complete], window[complete],
+                       sd_criterion, mean_criterion))
+    if carry is not None and len(carry):
+        window = pd.DatetimeIndex(carry.index).values.astype(
+                 'datetime64[ns]').view(np.int64) // window_ns
+        windows.append(window_means(carry, window, sd_criterion,
+                       mean_criterion))
+    if not windows:
+        return(pd.DataFrame(columns=columns))
+    return(pd.concat(windows, ignore_index=True))
+
+def window_means(df, window, sd_criterion, mean_criterion):
+    """
+    Function to summarize windows of accelerometry data and keep the ones
+    without movement.
+
+    Parameters
+    ----------
+    df : pandas dataframe
+        x, y, z and temperature columns
+
+    window : numpy array
+        window number of each row
+
+    sd_criterion : float
+        maximum standard deviation on each axis
+
+    mean_criterion : float
+        maximum absolute mean on each axis
+
+    Returns
+    -------
+    means : pandas dataframe
+        x, y, z and temperature means of each non-movement window
+    """
+    grouped = df.groupby(window)
+    means = grouped.mean()
+    sds = grouped[axes].std()
+    still = ((sds < sd_criterion).all(axis=1) & (means[axes].abs() <
+             mean_criterion).all(axis=1)).values
+    return(means[still].reset_index(drop=True))
+
+def fit_calibration(windows, use_temp=True, sphere_criterion=0.3,
+                    maxiter=1000, tol=1e-10):
+    """
+    Function to fit offset, scale and temperature coefficients to the means
+    of non-movement windows.
+
+    Parameters
+    ----------
+    windows : pandas dataframe
+        from nonmovement_windows()
+
+    use_temp : boolean
+        fit temperature coefficients (default=True)
+
+    sphere_criterion : float
+        every axis must have window means below -`sphere_criterion` and above
+        `sphere_criterion` for the fit to be attempted (default=0.3)
+
+    maxiter : int
+        maximum iterations (default=1000)
+
+    tol : float
+        convergence tolerance on the weighted residual (default=1e-10)
+
+    Returns
+    -------
+    coefficients : dictionary
+        'offset', 'scale' and 'tempoffset' (lists, one value per axis),
+        'meantemp', 'calibrated' (False if the data did not cover the sphere
+        well enough, in which case the coefficients are the identity), and
+        'error_start' and 'error_end' (mean absolute deviation of window
+        vector lengths from 1g before and after calibration)
+    """
+    coefficients = {'offset': [0.0, 0.0, 0.0], 'scale': [1.0, 1.0, 1.0],
+                    'tempoffset': [0.0, 0.0, 0.0], 'meantemp': 0.0,
+                    'calibrated': False, 'windows': len(windows)}
+    values = windows[axes].values.astype(np.float64)
+    coefficients['error_start'] = float(np.mean(np.abs(np.sqrt(np.sum(values
+                                  ** 2, axis=1)) - 1))) if len(values) else \
+                                  None
+    coefficients['error_end'] = coefficients['error_start']
+    if len(values) < 3 or not ((values.min(axis=0) < -sphere_criterion).all(
+       ) and (values.max(axis=0) > sphere_criterion).all()):
+        return(coefficients)
+    temperature = windows['temperature'].values.astype(np.float64)
+    meantemp = float(np.mean(temperature)) if use_temp else 0.0
+    temperature = temperature - meantemp if use_temp else np.zeros(len(
+                  values))
+    offset = np.zeros(3)
+    scale = np.ones(3)
+    tempoffset = np.zeros(3)
+    weights = np.ones(len(values))
+    residual = np.inf
+    for iteration in range(maxiter):
+        current = (values + offset) * scale + temperature[:, None] * tempoffset
+        closest = current / np.sqrt(np.sum(current ** 2, axis=1))[:, None]
+        offset_change = np.zeros(3)
+        scale_change = np.ones(3)
+        tempoffset_change = np.zeros(3)
+        root_weights = np.sqrt(weights)
+        for k in range(3):
+            design = np.column_stack([np.ones(len(values)), current[:, k],
+                     temperature] if use_temp else [np.ones(len(values)),
+                     current[:, k]])
+            fit = np.linalg.lstsq(design * root_weights[:, None], closest[:,
+                  k] * root_weights)[0]
+            offset_change[k] = fit[0]
+            scale_change[k] = fit[1]
+            if use_temp:
+                tempoffset_change[k] = fit[2]
+            current[:, k] = design.dot(fit)
+        offset = offset + offset_change / (scale * scale_change)
+        tempoffset = tempoffset * scale_change + tempoffset_change
+        scale = scale * scale_change
+        new_residual = 3 * np.mean(weights[:, None] * (current - closest) ** 2
+                       / np.sum(weights))
+        weights = np.minimum(1 / np.sqrt(np.sum((current - closest) ** 2,
+                  axis=1)), 1 / 0.01)
+        if abs(new_residual - residual) < tol:
+            break
+        residual = new_residual
+    calibrated = (values + offset) * scale + temperature[:, None] * tempoffset
+    coefficients.update({'offset': offset.tolist(), 'scale': scale.tolist(),
+                        'tempoffset': tempoffset.tolist(), 'meantemp':
+                        meantemp, 'calibrated': True, 'error_end': float(
+                        np.mean(np.abs(np.sqrt(np.sum(calibrated ** 2, axis=
+                        1)) - 1)))})
+    return(coefficients)
+
+def apply_calibration(df, coefficients):
+    """
+    Function to apply calibration coefficients to accelerometry data as a
+    vectorized transform.
+
+    Parameters
+    ----------
+    df : pandas dataframe
+        dataframe with x, y, z (g) and, if temperature coefficients are
+        non-zero, temperature columns
+
+    coefficients : dictionary
+        from fit_calibration()
+
+    Returns
+    -------
+    df : pandas dataframe
+        new dataframe with calibrated x, y, z columns
+    """
+    df = df.copy()
+    values = df[axes].values * np.array(coefficients['scale']) + np.array(
+             coefficients['offset']) * np.array(coefficients['scale'])
+    if any(coefficients['tempoffset']) and 'temperature' in df.columns:
+        values = values + (df['temperature'].values[:, None] - coefficients[
+                 'meantemp']) * np.array(coefficients['tempoffset'])
+    for i, axis in enumerate(axes):
+        df[axis] = values[:, i].astype(df[axis].dtype)
+    return(df)
+
+def calibrate_bin(bin_file, use_temp=True, pages_per_chunk=1000,
+                  cache_dir=None):
+    """
+    Function to get calibration coefficients for a GENEActiv .bin file,
+    fitting them in one streaming pass the first time and caching them in a
+    calibration.json file (invalidated when the file's size or mtime
+    changes). If the cache can't be written, e.g. on a read-only data mount,
+    the coefficients are returned uncached.
+
+    Parameters
+    ----------
+    bin_file : string
+        path to GENEActiv .bin file
+
+    use_temp : boolean
+        fit temperature coefficients (default=True)
+
+    pages_per_chunk : int
+        .bin pages to read at a time (default=1000)
+
+    cache_dir : string or None
+        directory to cache coefficients in, e.g. the organized data
+        directory, as `bin_file`.`path hash`.calibration.json (default=None,
+        i.e. `bin_file`.calibration.json beside the .bin file)
+
+    Returns
+    -------
+    coefficients : dictionary
+        from fit_calibration()
+    """
+    cache_file = calibration_cache_file(bin_file, cache_dir)
+    stat = os.stat(bin_file)
+    if os.path.exists(cache_file):
+        with open(cache_file) as fp:
+            cached = json.load(fp)
+        if cached.get('size') == stat.st_size and cached.get('mtime') == \
+           stat.st_mtime_ns and cached.get('use_temp') == use_temp:
+            return(cached['coefficients'])
+    coefficients = fit_calibration(nonmovement_windows(read_bin(bin_file,
+                   pages_per_chunk)), use_temp)
+    if coefficients['calibrated']:
+        print(' : '.join(['Calibrated', os.path.basename(bin_file), ' '.join([
+              'error', str(coefficients['error_start']), '→', str(
+              coefficients['error_end'])])]))
+    else:
+        print(' : '.join(['Not enough non-movement data to calibrate',
+              os.path.basename(bin_file)]))
+    try:
+        with open(cache_file, 'w') as fp:
+            json.dump({'size': stat.st_size, 'mtime': stat.st_mtime_ns,
+                      'use_temp': use_temp, 'coefficients': coefficients}, fp,
+                      indent=2)
+    except OSError as e:
+        print(' : '.join(['Could not cache calibration', cache_file, str(e)]))
+    return(coefficients)
+
+def calibration_cache_file(bin_file, cache_dir=None):
+    """
+    Function to get the path of the cached calibration coefficients of a
+    GENEActiv .bin file.
+
+    Parameters
+    ----------
+    bin_file : string
+        path to GENEActiv .bin file
+
+    cache_dir : string or None
+        cache directory (default=None, i.e. beside the .bin file)
+
+    Returns
+    -------
+    cache_file : string
+        `bin_file`.calibration.json, or `cache_dir`/`bin file name`.`path
+        hash`.calibration.json so same-named files from different
+        directories don't collide
+    """
+    if not cache_dir:
+        return('.'.join([bin_file, 'calibration', 'json']))
+    path_hash = hashlib.md5(os.path.abspath(bin_file).encode('utf-8')
+                ).hexdigest()[:12]
+    return(os.path.join(cache_dir, '.'.join([os.path.basename(bin_file),
+           path_hash, 'calibration', 'json'])))
+
+def calibrated_bin(bin_file, pages_per_chunk=None, use_temp=True,
+                   cache_dir=None):
+    """
+    Function to read a GENEActiv .bin file with calibration applied chunk by
+    chunk.
+
+    Parameters
+    ----------
+    bin_file : string
+        path to GENEActiv .bin file
+
+    pages_per_chunk : int or None
+        if given, yield dataframes of this many pages instead of returning
+        one dataframe (default=None)
+
+    use_temp : boolean
+        fit and apply temperature coefficients (default=True)
+
+    cache_dir : string or None
+        directory to cache coefficients in (see calibrate_bin();
+        default=None)
+
+    Returns
+    -------
+    df : pandas dataframe or generator of pandas dataframes
+        read_bin() output with calibrated x, y, z columns
+    """
+    coefficients = calibrate_bin(bin_file, use_temp, cache_dir=cache_dir)
+    chunks = (apply_calibration(chunk, coefficients) for chunk in read_bin(
+              bin_file, pages_per_chunk if pages_per_chunk else 1000))
+    if pages_per_chunk:
+        return(chunks)
+    return(pd.concat(list(chunks)))
+
+# ============================================================================
+if __name__ == '__main__':
+    main()
@@ -6,28 +6,30 @@ chart_data.py
 Functions to organize data into charts from which we can compare
 our devices.
 
+Plotting backends (matplotlib, plotly, holoviews, astropy) are imported the
+first time a chart needs them, so importing this module for the numerical
+functions it re-exports from correlate_data.py stays cheap.
+
 Created on Mon Apr 10 17:25:39 2017
 
 @author: jon.clucas
 """
-# from utilities.analysis_2 import *
-from astropy.stats import median_absolute_deviation as mad
-from config import config
-from datetime import datetime, timedelta
+from utilities.correlate_data import device_lags, df_devices_qt, \
+                                     fft_correlate, rolling_correlations, \
+                                     rolling_window, window_sums, xcorr, \
+                                     xcorr_lag
+from utilities.decimate_data import decimate, decimate_series, plot_points
 from utilities.fetch_data import fetch_check_data, fetch_data, fetch_hash
-from utilities.normalize_acc_data import normalize as norm
 import json, numpy as np, os, pandas as pd
-from matplotlib.dates import DateFormatter
-import matplotlib.pyplot as plt
-from plotly.offline import download_plotlyjs, init_notebook_mode, iplot
-from plotly.graph_objs import *
-init_notebook_mode()
-import holoviews as hv
-hv.extension('bokeh')
-with open(os.path.join('./config/device_colors.json')) as fp:
+# colour files, relative to the package rather than the working directory
+config_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(
+             __file__))), 'config')
+with open(os.path.join(config_dir, 'device_colors.json')) as fp:
     color_key = json.load(fp)
-with open(os.path.join('./config/CMI_colors/Color_palette.json')) as fp:
+with open(os.path.join(config_dir, 'CMI_colors', 'Color_palette.json')) as fp:
     color_palette = json.load(fp)
+# plotting backends loaded so far, by name
+backends = {}
 
 def bland_altman_plot(data1, data2, *args, **kwargs):
     """
@@ -41,6 +43,7 @@ def bland_altman_plot(data1, data2, *args, **kwargs):
     *args, **kwargs : various types
         additional arguments for plotting
     """
+    plt = pyplot()
     data1     = np.asarray(data1)
     data2     = np.asarray(data2)
     mean      = np.mean([data1, data2], axis=0)
@@ -52,54 +55,95 @@ def bland_altman_plot(data1, data2, *args, **kwargs):
     plt.axhline(md,           color='gray', linestyle='--')
     plt.axhline(md + 1.96*sd, color='gray', linestyle='--')
     plt.axhline(md - 1.96*sd, color='gray', linestyle='--')
-        
-def df_devices_qt(devices, sensor, start, stop, acc_hashes={}):
+
+
+def device_colors(columns):
     """
-    Function to calculate rolling correlations between two sensor data streams.
-    
+    Function to choose a line colour for each device column: the colour in
+    config/device_colors.json whose key is in the device name, otherwise the
+    next colour of the CMI palette.
+
     Parameters
     ----------
-    devices : list of (subdirectory, device) tuples (len 2)
-        each string is the name of one of the two devices to compare
-        
-    sensor : string
-        the sensor to compare
-        
-    start : datetime
-        beginning of time to compare
-        
-    stop : datetime
-        end of time to compare
-        
-    acc_hashes : dictionary
-        dictionary of cached datafile hashes
-        
+    columns : list of strings
+        device column names
+
     Returns
     -------
-    df : pandas dataframe
-        merged dataframe with a column per device
+    colors : list of strings
+        hex colour per column
+    """
+    palette = [color for colors in color_palette.values() for color in
+               colors]
+    colors = []
+    for column in columns:
+        matches = [color_key[c] for c in color_key if c in column]
+        colors.append(matches[-1] if matches else palette[sum(c in palette for
+                      c in colors) % len(palette)])
+    return(colors)
+
+
+def device_label(column):
+    """
+    Function to label a device column in a legend.
+
+    Parameters
+    ----------
+    column : string
+        device column name
+
+    Returns
+    -------
+    label : string
+        column name without a leading 'normalized_vector_length_'
+    """
+    return(column[25:] if column.startswith('normalized') else column)
+
+
+def device_spread(values):
+    """
+    Function to measure the spread of a device's values for a y limit: the
+    median absolute deviation, or the standard deviation if that is 0, or
+    the maximum if that is 0 too.
+
+    Parameters
+    ----------
+    values : numpy array
+        values without NaNs
+
+    Returns
+    -------
+    spread : float
+        spread (0 if there are no values)
+    """
+    if not len(values):
+        return(0)
+    for spread in [np.median(np.abs(values - np.median(values))), np.std(
+                   values, ddof=1) if len(values) > 1 else 0]:
+        if spread > 0:
+            return(float(spread))
+    return(float(np.max(values)))
+
+
+def holoviews():
     """
-    suffix = '.csv'
-    s = []
-    for i, device in enumerate(devices):
-        s.append(pd.read_csv(fetch_data(config.rawurls[
-                 sensor][device[1]]),
-                 parse_dates=['Timestamp'], infer_datetime_format=True))
-        s[i] = s[i].loc[(s[i]['Timestamp'] >= start) & (s[i]['Timestamp'] <=
-               stop)].copy()
-        s[i] = norm(s[i])
-        if device[1] == 'ActiGraph wGT3X-BT':
-            s[i][['Timestamp']] = s[i].Timestamp.apply(lambda x: x - 
-                                  timedelta(microseconds=1000))
-        s[i].set_index('Timestamp', inplace=True)
-    df = s[0].merge(s[1], left_index=True, right_index=True, suffixes=(''.join(
-         ['_', devices[0][1]]), ''.join(['_', devices[1][1]])))
-    for i in range(2, len(s), 1):
-        df = df.merge(s[i], left_index=True, right_index=True, suffixes=('', ''.join(['_', devices[i][1]])))
-    return(df)
-
-
-def hvplot(device_data, device_names):
+    Function to import holoviews with the bokeh extension the first time
+    it's needed.
+
+    Returns
+    -------
+    hv : module
+        holoviews
+    """
+    if 'holoviews' not in backends:
+        import holoviews as hv
+        hv.extension('bokeh')
+        backends['holoviews'] = hv
+    return(backends['holoviews'])
+
+
+def hvplot(device_data, device_names, max_points=plot_points,
+           method='minmax'):
     """
     Function to build a plotly line plot from device data from one or more
     devices.
@@ -111,18 +155,27 @@ def hvplot(device_data, device_names):
     
     device_names: list
         ordered list of names, one per dataframe
+
+    max_points: int or None
+        most points to plot per column (see decimate_data.decimate())
+
+    method: string
+        decimation method, 'minmax' or 'lttb'
     """
+    hv = holoviews()
     data = list()
     for i, path in enumerate(device_data):
         for column in list(path.columns):
             if not column == 'Timestamp':
-                data.append(hv.Scatter(path, kdims=['Timestamp'], vdims=[column
-                            ]))
+                data.append(hv.Scatter(path.iloc[decimate(path['Timestamp'
+                            ].values, path[column].values, max_points, method
+                            )], kdims=['Timestamp'], vdims=[column]))
     layout = hv.Layout(data).cols(1)
     return(layout)
-    
 
-def linechart(df, plot_label, line=True, full=False):
+
+def linechart(df, plot_label, line=True, full=False, max_points=plot_points,
+              method='minmax'):
     """
     Function to build a linechart and export a PNG and an SVG of the image.
     
@@ -139,6 +192,13 @@ def linechart(df, plot_label, line=True, full=False):
         
     full : boolean
         True for ylim=[0, 1], False for ylim=[0, 3×max(mad)
+
+    max_points : int or None
+        most points to plot per device (see decimate_data.decimate()); MAD
+        is still calculated from every sample
+
+    method : string
+        decimation method, 'minmax' or 'lttb'
         
     Returns
     -------
@@ -149,6 +209,8 @@ def linechart(df, plot_label, line=True, full=False):
     -------
     inline plot
     """
+    from matplotlib.dates import DateFormatter
+    plt = pyplot()
     try:
         start = min(df.index.values)
     except:
@@ -162,45 +224,14 @@ def linechart(df, plot_label, line=True, full=False):
     ax = fig.add_subplot(111)
     ax.set_ylabel('unit cube normalized vector length')
     mad_values = []
-    ci = [0, 0]
-    cls = list(color_palette.keys())
-    for i, device in enumerate(list(df.columns)):
-        if device.startswith('normalized'):
-            d2 = device[25:]
-        else:
-            d2 = device
-        plot_line = df[[device]].dropna()
-        mp = mad(plot_line)
-        if mp > 0:
-            print(mp)
-            mad_values.append(mp)
-        else:
-            mp = plot_line.std()[0]
-            if mp > 0:
-                print(mp)
-                mad_values.append(mp)
-            else:
-                print(max(plot_line[[device]]))
-                mad_values.append(max(plot_line[[device]]))
-        label = d2
-        for c in color_key:
-            if c in d2 or d2 in c:
-                cmap = color_key[c]
-            if not cmap:
-                cmap = color_palette[cls[ci[0]]][ci[1]]
-                if ci[1] < len(color_palette[cls[ci[0]]]) - 1:
-                    ci[1] = ci[1] + 1
-                else:
-                    ci[0] = ci[0] + 1 if ci[0] < (len(color_palette.keys()) - 1) else 0
-                    ci[1] = 0
-        if line:
-            ax.plot_date(x=plot_line.index, y=plot_line, alpha=0.4,
-                         label=label, marker="", linestyle="solid",
-                         color=cmap)
-        else:
-            ax.plot_date(x=plot_line.index, y=plot_line, alpha=0.4,
-                         label=label, marker="o", linestyle="None",
-                         color=cmap)
+    for device, color in zip(df.columns, device_colors(list(df.columns))):
+        plot_line = df[device].dropna()
+        mad_values.append(device_spread(plot_line.values.astype(np.float64)))
+        print(mad_values[-1])
+        plot_line = decimate_series(plot_line, max_points, method)
+        ax.plot(plot_line.index, plot_line.values, alpha=0.4, label=
+                device_label(device), marker="" if line else "o", linestyle=
+                "solid" if line else "None", color=color)
         ax.legend(loc='best', fancybox=True, framealpha=0.5)
     try:
         ylim = max(mad_values)
@@ -220,7 +251,131 @@ def linechart(df, plot_label, line=True, full=False):
     return True
 
 
-def plplot(device_data, device_names):
+def linechart_windows(df, window, out_dir, start=None, stop=None,
+                      formats=['png', 'svg'], line=True, full=False,
+                      max_points=plot_points, method='minmax',
+                      processes=None):
+    """
+    Function to render consecutive time windows of a merged dataframe as
+    linecharts and export a PNG and an SVG of each, as a batch job. Window
+    rows are found with searchsorted on the time index (no masks or
+    copies), the y limit is calculated once from the MAD of the whole range,
+    and each worker draws one figure and updates its lines for every window.
+
+    Parameters
+    ----------
+    df : pandas dataframe
+        merged dataframe with a time-series index and a column per device
+
+    window : timedelta-like
+        window length (e.g. '10s')
+
+    out_dir : string
+        directory to write the charts to
+
+    start : datetime-like or None
+        start of the first window (default=None, i.e. the first timestamp)
+
+    stop : datetime-like or None
+        time to stop starting windows (default=None, i.e. the last timestamp)
+
+    formats : list of strings
+        file formats to write (default=['png', 'svg'])
+
+    line : boolean
+        True for lineplot, False for scatterplot
+
+    full : boolean
+        True for ylim=[0, 1], False for ylim=[0, 3×max(mad)]
+
+    max_points : int or None
+        most points to plot per device per window (see
+        decimate_data.decimate())
+
+    method : string
+        decimation method, 'minmax' or 'lttb'
+
+    processes : int or None
+        render across this many processes (default=None, i.e. in this
+        process)
+
+    Returns
+    -------
+    paths : list of strings
+        files written, in window order; windows without data are skipped
+
+    Outputs
+    -------
+    image files
+        `out_dir`/`window start`.`format` for each window and format
+    """
+    if not df.index.is_monotonic_increasing:
+        df = df.sort_index(kind='mergesort')
+    ns = pd.DatetimeIndex(df.index).values.astype('datetime64[ns]').view(
+         np.int64)
+    if not len(ns):
+        return([])
+    window_ns = pd.Timedelta(window).value
+    first_ns = pd.Timestamp(start).value if start is not None else ns[0]
+    last_ns = pd.Timestamp(stop).value if stop is not None else ns[-1]
+    starts = np.arange(first_ns, max(last_ns, first_ns + 1), window_ns)
+    lows = np.searchsorted(ns, starts, side='left')
+    highs = np.searchsorted(ns, starts + window_ns, side='right')
+    values = df.values[lows[0]:highs[-1]].astype(np.float64)
+    ylim = [0, 1]
+    if not full:
+        spreads = [device_spread(v[np.isfinite(v)]) for v in values.T]
+        ylim = [0, 3 * max(spreads)] if spreads and max(spreads) > 0 else \
+               ylim
+    os.makedirs(out_dir, exist_ok=True)
+    windows = []
+    for low, high, window_start in zip(lows, highs, starts):
+        if high > low:
+            t0, t1 = [pd.Timestamp(int(t)) for t in [window_start,
+                      window_start + window_ns]]
+            windows.append((int(low), int(high), t0, t1, '–'.join([
+                           t0.strftime('%H:%M:%S'), t1.strftime('%H:%M:%S')]),
+                           os.path.join(out_dir, t0.strftime(
+                           '%Y-%m-%dT%H-%M-%S.%f'))))
+    options = {'formats': formats, 'ylim': ylim, 'colors': device_colors(
+               list(df.columns)), 'line': line, 'max_points': max_points,
+               'method': method}
+    if not processes or processes < 2 or len(windows) < 2:
+        return(render_windows(df, windows, **options))
+    from concurrent.futures import ProcessPoolExecutor
+    groups = [g for g in np.array_split(np.arange(len(windows)), processes) if
+              len(g)]
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        futures = []
+        for group in groups:
+            offset = windows[group[0]][0]
+            futures.append(pool.submit(render_windows, df.iloc[offset:windows[
+                           group[-1]][1]], [(low - offset, high - offset, t0,
+                           t1, label, path) for low, high, t0, t1, label, path
+                           in windows[group[0]:group[-1] + 1]], **options))
+        return([path for future in futures for path in future.result()])
+
+
+def plotly():
+    """
+    Function to import plotly's graph objects and start notebook mode the
+    first time they're needed.
+
+    Returns
+    -------
+    graph_objs : module
+        plotly.graph_objs
+    """
+    if 'plotly' not in backends:
+        from plotly.offline import init_notebook_mode
+        import plotly.graph_objs as graph_objs
+        init_notebook_mode()
+        backends['plotly'] = graph_objs
+    return(backends['plotly'])
+
+
+def plplot(device_data, device_names, max_points=plot_points,
+           method='minmax'):
     """
     Function to build a plotly line plot from device data from one or more
     devices.
@@ -232,47 +387,110 @@ def plplot(device_data, device_names):
     
     device_names: list
         ordered list of names, one per dataframe
+
+    max_points: int or None
+        most points to plot per column (see decimate_data.decimate())
+
+    method: string
+        decimation method, 'minmax' or 'lttb'
     """
+    Scatter = plotly().Scatter
     data = list()
     for i, path in enumerate(device_data):
         for column in list(path.columns):
             if not column == 'Timestamp':
-                data.append(Scatter(x=path['Timestamp'], y=path[column], name=
+                kept = path.iloc[decimate(path['Timestamp'].values, path[
+                       column].values, max_points, method)]
+                data.append(Scatter(x=kept['Timestamp'], y=kept[column], name=
                             ': '.join([device_names[i], column])))
     return(data)
 
 
-def rolling_window(a, window):
-    # http://wichita.ogs.ou.edu/documents/python/xcor.py
-    shape = a.shape[:-1] + (a.shape[-1] - window + 1, window)
-    strides = a.strides + (a.strides[-1],)
-    return np.lib.stride_tricks.as_strided(a, shape=shape, strides=strides)  
+def pyplot():
+    """
+    Function to import matplotlib.pyplot the first time it's needed.
+
+    Returns
+    -------
+    plt : module
+        matplotlib.pyplot
+    """
+    if 'pyplot' not in backends:
+        import matplotlib.pyplot as plt
+        backends['pyplot'] = plt
+    return(backends['pyplot'])
 
 
-def xcorr(x,y):
+def render_windows(df, windows, formats, ylim, colors, line=True,
+                   max_points=plot_points, method='minmax'):
     """
-    c=xcor(x,y)
-    Fast implementation to compute the normalized cross correlation where x and
-    y are 1D numpy arrays
-    x is the timeseries
-    y is the template time series
-    returns a numpy 1D array of correlation coefficients, c"
-  
-    The standard deviation algorithm in numpy is the biggest slow down in this
-    method.  
-    The issue has been identified hopefully they make improvements.
-
-    http://wichita.ogs.ou.edu/documents/python/xcor.py
+    Function to draw one figure and save it once per window, updating only
+    the line data, x limits and title between windows. Runs in worker
+    processes, so it draws with the Agg canvas rather than pyplot.
+
+    Parameters
+    ----------
+    df : pandas dataframe
+        merged dataframe with a time-series index, sorted
+
+    windows : list of tuples
+        (first row, end row, start time, stop time, title, path without
+        extension) for each window
+
+    formats : list of strings
+        file formats to write
+
+    ylim : list of floats
+        y limits
+
+    colors : list of strings
+        colour per column
+
+    line : boolean
+        True for lineplot, False for scatterplot
+
+    max_points : int or None
+        most points to plot per device per window
+
+    method : string
+        decimation method
+
+    Returns
+    -------
+    paths : list of strings
+        files written
     """
-    N = len(x)
-    M = len(y)
-    meany = np.nanmean(y)
-    stdy = np.nanstd(np.asarray(y))
-    tmp = rolling_window(x,M)
-    c = np.nansum((y-meany)*(tmp-np.reshape(np.nanmean(tmp,-1),(N-M+1,1))),-1
-        )/(M*np.nanstd(tmp,-1)*stdy)
-    return(c)
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.dates import DateFormatter, date2num
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=(10, 8), dpi=75)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    ax.set_ylabel('unit cube normalized vector length')
+    ax.set_ylim(ylim)
+    ax.xaxis_date()
+    ax.xaxis.set_major_formatter(DateFormatter('%H:%M:%S'))
+    lines = [ax.plot([], [], alpha=0.4, label=device_label(column), marker=
+             "" if line else "o", linestyle="solid" if line else "None",
+             color=color)[0] for column, color in zip(df.columns, colors)]
+    ax.legend(loc='best', fancybox=True, framealpha=0.5)
+    for label in ax.get_xticklabels():
+        label.set_rotation(65)
+    title = fig.suptitle('')
+    x = date2num(pd.DatetimeIndex(df.index).values)
+    values = [df[column].values for column in df.columns]
+    paths = []
+    for low, high, t0, t1, label, path in windows:
+        for plot_line, y in zip(lines, values):
+            kept = low + decimate(x[low:high], y[low:high], max_points, method)
+            plot_line.set_data(x[kept], y[kept])
+        ax.set_xlim(date2num(t0.to_datetime64()), date2num(t1.to_datetime64()))
+        title.set_text(label)
+        for file_format in formats:
+            fig.savefig('.'.join([path, file_format]), format=file_format)
+            paths.append('.'.join([path, file_format]))
+    return(paths)
 
 # ============================================================================
 if __name__ == '__main__':
-    pass
\ No newline at end of file
+    pass
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+correlate_data.py
+
+Functions to build merged dataframes from our devices and to compare them
+numerically (cross-correlations, lags and rolling correlations), without any
+plotting backend, so batch workers can import them cheaply.
+
+@author: jon.clucas
+"""
+from utilities.align_data import align_devices, device_offsets
+from utilities.fetch_data import fetch_store
+from utilities.normalize_acc_data import normalize as norm
+from utilities.store_data import load_store
+import numpy as np, pandas as pd
+
+def main():
+    pass
+
+def device_lags(df, max_lag=None, columns=None):
+    """
+    Function to estimate the lag between every pair of device columns in a
+    merged, equally sampled dataframe with xcorr_lag().
+
+    Parameters
+    ----------
+    df : pandas dataframe
+        merged dataframe with a column per device (e.g. from df_devices_qt)
+
+    max_lag : int or None
+        largest lag in samples to consider (default=None, any lag)
+
+    columns : list of strings or None
+        columns to compare (default=None, i.e. all columns)
+
+    Returns
+    -------
+    lags : pandas dataframe
+        one row per device pair with columns 'device_1', 'device_2', 'lag'
+        (samples by which device_1 lags device_2) and 'confidence'
+        (correlation at that lag)
+    """
+    from itertools import combinations
+    columns = columns if columns else list(df.columns)
+    rows = []
+    for device_1, device_2 in combinations(columns, 2):
+        best, confidence = xcorr_lag(df[device_1].values, df[device_2].values,
+                           max_lag)
+        rows.append({'device_1': device_1, 'device_2': device_2, 'lag': best,
+                    'confidence': confidence})
+    return(pd.DataFrame(rows, columns=['device_1', 'device_2', 'lag',
+           'confidence']))
+
+
+def df_devices_qt(devices, sensor, start, stop, acc_hashes={}, offsets=None,
+                  tolerance=None, columns=None):
+    """
+    Function to build a merged dataframe of two or more sensor data streams
+    from which to calculate rolling correlations (see rolling_correlations()).
+    
+    Parameters
+    ----------
+    devices : list of (subdirectory, device) tuples (len 2)
+        each string is the name of one of the two devices to compare
+        
+    sensor : string
+        the sensor to compare
+        
+    start : datetime
+        beginning of time to compare
+        
+    stop : datetime
+        end of time to compare
+        
+    acc_hashes : dictionary
+        dictionary of cached datafile hashes
+
+    offsets : dictionary
+        timedelta to add to each device's timestamps, by device name (default:
+        align_data.device_offsets)
+
+    tolerance : timedelta
+        largest difference between aligned timestamps (default: exact)
+
+    columns : list of strings
+        value columns to load, including 'x', 'y' and 'z' (default: all)
+        
+    Returns
+    -------
+    df : pandas dataframe
+        merged dataframe with a column per device, named
+        `column`_`device name`
+    """
+    offsets = device_offsets if offsets is None else offsets
+    s = []
+    for i, device in enumerate(devices):
+        s.append(load_store(fetch_store(sensor, device[1]), start, stop,
+                 columns))
+        s[i] = norm(s[i])
+        s[i].set_index('Timestamp', inplace=True)
+        s[i].columns = [''.join([c, '_', device[1]]) for c in s[i].columns]
+    return(align_devices(s, [offsets.get(device[1]) for device in devices],
+           tolerance))
+
+
+def fft_correlate(a, b, nfft):
+    """
+    Function to compute the circular cross-correlation c[k] = Σ a[n+k]·b[n]
+    of two real 1D arrays by FFT. With `nfft` ≥ len(a) + len(b) - 1, lag k is
+    at c[k] for k ≥ 0 and at c[nfft + k] for k < 0; with `nfft` ≥ len(a),
+    lags 0 to len(a) - len(b) are exact.
+
+    Parameters
+    ----------
+    a, b : numpy arrays
+        1D arrays without NaNs
+
+    nfft : int
+        FFT length
+
+    Returns
+    -------
+    c : numpy array
+        cross-correlation of length `nfft`
+    """
+    return(np.fft.irfft(np.fft.rfft(a, nfft) * np.conj(np.fft.rfft(b, nfft)),
+           nfft))
+
+
+def rolling_correlations(df, window, stride=1, columns=None,
+                         min_periods=None):
+    """
+    Function to calculate rolling Pearson correlations between every pair of
+    device columns in one vectorized pass per pair, from running sums of the
+    pairwise non-NaN samples.
+
+    Parameters
+    ----------
+    df : pandas dataframe
+        merged dataframe with a time-series index and a column per device
+        (e.g. from df_devices_qt)
+
+    window : int or timedelta-like
+        window length in samples, or as a duration (e.g. '10s') converted to
+        samples with the median sampling interval
+
+    stride : int or timedelta-like
+        step between window starts, in samples or as a duration (default=1)
+
+    columns : list of strings or None
+        columns to correlate (default=None, i.e. all columns)
+
+    min_periods : int or None
+        fewest pairwise non-NaN samples for a window to get a correlation
+        (default=None, i.e. half the window)
+
+    Returns
+    -------
+    correlations : pandas dataframe
+        float32 correlations indexed by window start, with one column per
+        device pair (a ('device_1', 'device_2') MultiIndex)
+    """
+    from itertools import combinations
+    columns = columns if columns else list(df.columns)
+    window, stride = [samples if isinstance(samples, (int, np.integer)) else
+                      int(round(pd.Timedelta(samples) / pd.Series(
+                      df.index).diff().median())) for samples in [window,
+                      stride]]
+    min_periods = min_periods if min_periods else max(2, window // 2)
+    starts = np.arange(0, len(df) - window + 1, max(1, stride))
+    values = {c: df[c].values.astype(np.float64) for c in columns}
+    # centering does not change r and keeps the running sums well conditioned
+    values = {c: v - np.nanmean(v) for c, v in values.items()}
+    sums = lambda a: window_sums(a, window)[starts]
+    pairs = list(combinations(columns, 2))
+    correlations = np.empty((len(starts), len(pairs)), dtype=np.float32)
+    for i, (device_1, device_2) in enumerate(pairs):
+        mask = np.isfinite(values[device_1]) & np.isfinite(values[device_2])
+        a = np.where(mask, values[device_1], 0)
+        b = np.where(mask, values[device_2], 0)
+        n = sums(mask.astype(np.float64))
+        sa = sums(a)
+        sb = sums(b)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            r = (n * sums(a * b) - sa * sb) / np.sqrt((n * sums(a ** 2) - sa **
+                2) * (n * sums(b ** 2) - sb ** 2))
+        correlations[:, i] = np.where(n >= min_periods, r, np.nan)
+    return(pd.DataFrame(correlations, index=df.index[starts], columns=
+           pd.MultiIndex.from_tuples(pairs, names=['device_1', 'device_2'])))
+
+
+def rolling_window(a, window):
+    # http://wichita.ogs.ou.edu/documents/python/xcor.py
+    shape = a.shape[:-1] + (a.shape[-1] - window + 1, window)
+    strides = a.strides + (a.strides[-1],)
+    return np.lib.stride_tricks.as_strided(a, shape=shape, strides=strides)
+
+
+def window_sums(a, window):
+    """
+    Function to compute the sum of every length-`window` sliding window of a
+    1D array from its cumulative sum.
+
+    Parameters
+    ----------
+    a : numpy array
+        1D array without NaNs
+
+    window : int
+        window length
+
+    Returns
+    -------
+    sums : numpy array
+        array of length len(a) - window + 1
+    """
+    cumulative = np.concatenate([[0], np.cumsum(a)])
+    return(cumulative[window:] - cumulative[:-window])
+
+
+def xcorr(x,y):
+    """
+    c=xcor(x,y)
+    Fast implementation to compute the normalized cross correlation where x and
+    y are 1D numpy arrays
+    x is the timeseries
+    y is the template time series
+    returns a numpy 1D array of correlation coefficients, c"
+
+    Window means and standard deviations of x come from cumulative sums and
+    the products with the template from FFT cross-correlation, so the cost is
+    O(N log N) with O(N) memory instead of an (N-M+1)×M window matrix. NaNs
+    are handled with count arrays and give the same result as the nanmean /
+    nanstd / nansum formulation. float32 input gives float32 output.
+
+    http://wichita.ogs.ou.edu/documents/python/xcor.py
+    """
+    dtype = np.result_type(np.asarray(x).dtype, np.asarray(y).dtype,
+            np.float32)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    N = len(x)
+    M = len(y)
+    meany = np.nanmean(y)
+    stdy = np.nanstd(y)
+    xm = np.isfinite(x)
+    # centering x does not change c and keeps the running sums well
+    # conditioned
+    x0 = np.where(xm, x - np.nanmean(x), 0)
+    yc = np.where(np.isfinite(y), y - meany, 0)
+    count = window_sums(xm.astype(np.float64), M)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        meanx = window_sums(x0, M) / count
+        stdx = np.sqrt(np.maximum(window_sums(x0 ** 2, M) / count - meanx ** 2,
+               0))
+        nfft = 1 << (N - 1).bit_length()
+        c = (fft_correlate(x0, yc, nfft)[:N-M+1] - meanx * fft_correlate(
+            xm.astype(np.float64), yc, nfft)[:N-M+1]) / (M * stdx * stdy)
+    return(c.astype(dtype))
+
+
+def xcorr_lag(x, y, max_lag=None, min_overlap=None):
+    """
+    Function to estimate the lag between two equally sampled series by FFT
+    cross-correlation in O((N + M) log(N + M)) time. Each lag is scored by
+    the Pearson correlation of the overlapping, non-NaN samples, with the
+    overlap counts, sums and sums of squares also computed by FFT.
+
+    Parameters
+    ----------
+    x, y : numpy arrays
+        1D arrays; NaNs are ignored
+
+    max_lag : int or None
+        largest absolute lag in samples to consider (default=None, any lag)
+
+    min_overlap : int or None
+        fewest overlapping non-NaN samples for a lag to be considered
+        (default=None, i.e. half the shorter series)
+
+    Returns
+    -------
+    lag : int
+        lag in samples, positive if x is delayed relative to y (x[n + lag]
+        matches y[n]; the same convention as np.argmax(np.correlate(x, y,
+        mode='full')) - (len(y) - 1))
+
+    confidence : float
+        correlation coefficient at that lag (NaN if no lag qualifies)
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    N = len(x)
+    M = len(y)
+    xm = np.isfinite(x).astype(np.float64)
+    ym = np.isfinite(y).astype(np.float64)
+    x0 = np.where(xm > 0, x - np.nanmean(x), 0)
+    y0 = np.where(ym > 0, y - np.nanmean(y), 0)
+    nfft = 1 << (N + M - 2).bit_length()
+    X0, XM, XX = [np.fft.rfft(a, nfft) for a in [x0, xm, x0 ** 2]]
+    Y0, YM, YY = [np.conj(np.fft.rfft(a, nfft)) for a in [y0, ym, y0 ** 2]]
+    n = np.round(np.fft.irfft(XM * YM, nfft))
+    sx = np.fft.irfft(X0 * YM, nfft)
+    sy = np.fft.irfft(XM * Y0, nfft)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r = (np.fft.irfft(X0 * Y0, nfft) - sx * sy / n) / np.sqrt((
+            np.fft.irfft(XX * YM, nfft) - sx ** 2 / n) * (np.fft.irfft(XM *
+            YY, nfft) - sy ** 2 / n))
+    lags = np.arange(nfft)
+    lags = np.where(lags < N, lags, lags - nfft)
+    valid = (lags > -M) & (lags < N) & (n >= (min_overlap if min_overlap else
+            max(2, min(N, M) // 2))) & np.isfinite(r)
+    if max_lag is not None:
+        valid &= np.abs(lags) <= max_lag
+    if not valid.any():
+        return(0, np.nan)
+    best = np.argmax(np.where(valid, r, -np.inf))
+    return(int(lags[best]), float(r[best]))
+
+# ============================================================================
+if __name__ == '__main__':
+    main()
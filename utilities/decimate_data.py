@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+decimate_data.py
+
+Functions to reduce long time series to a target number of points for
+plotting while preserving their visual envelope, either by keeping the
+minimum and maximum sample in each pixel-wide bucket ('minmax') or by
+Largest-Triangle-Three-Buckets ('lttb', Steinarsson 2013).
+
+@author: jon.clucas
+"""
+import numpy as np
+# default number of points to keep per plotted series
+plot_points = 4000
+
+def main():
+    pass
+
+def decimate(x, y, max_points=plot_points, method='minmax'):
+    """
+    Function to choose which samples of a series to plot.
+
+    Parameters
+    ----------
+    x : numpy array
+        sorted sample times (numeric or datetime64)
+
+    y : numpy array
+        sample values
+
+    max_points : int or None
+        most samples to keep (default=`plot_points`); None keeps all
+
+    method : string
+        'minmax' to keep the first, minimum, maximum and last sample of each
+        of `max_points` / 4 equal-width buckets of x, or 'lttb' for
+        Largest-Triangle-Three-Buckets (default='minmax')
+
+    Returns
+    -------
+    indices : numpy array
+        sorted indices of the samples to keep; NaN values are never kept
+    """
+    y = np.asarray(y, dtype=np.float64)
+    finite = np.flatnonzero(np.isfinite(y))
+    if not max_points or len(finite) <= max_points:
+        return(finite)
+    x = np.asarray(x)
+    x = (x.astype('datetime64[ns]').view(np.int64) if np.issubdtype(x.dtype,
+        np.datetime64) else x)[finite].astype(np.float64)
+    y = y[finite]
+    if method == 'lttb':
+        return(finite[lttb_indices(x, y, max_points)])
+    if method == 'minmax':
+        return(finite[minmax_indices(x, y, max(max_points // 4, 1))])
+    raise ValueError("Unknown decimation method: {0}".format(method))
+
+def decimate_series(series, max_points=plot_points, method='minmax', x=None):
+    """
+    Function to decimate a pandas series for plotting (see decimate()).
+
+    Parameters
+    ----------
+    series : pandas series
+        values, indexed by time unless `x` is given
+
+    max_points : int or None
+        most samples to keep (default=`plot_points`)
+
+    method : string
+        'minmax' or 'lttb' (default='minmax')
+
+    x : array-like or None
+        sample times if not the index (default=None)
+
+    Returns
+    -------
+    series : pandas series
+        the kept samples
+    """
+    x = series.index.values if x is None else np.asarray(x)
+    return(series.iloc[decimate(x, series.values, max_points, method)])
+
+def minmax_indices(x, y, buckets):
+    """
+    Function to find the first, minimum, maximum and last sample of each of
+    `buckets` equal-width x buckets in one vectorized pass.
+
+    Parameters
+    ----------
+    x : numpy array
+        sorted float sample times
+
+    y : numpy array
+        float sample values without NaNs
+
+    buckets : int
+        number of buckets, e.g. the plot's width in pixels
+
+    Returns
+    -------
+    indices : numpy array
+        sorted unique indices
+    """
+    span = x[-1] - x[0]
+    bucket = np.minimum(((x - x[0]) * buckets / span).astype(np.int64) if
+             span > 0 else np.zeros(len(x), dtype=np.int64), buckets - 1)
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    ends = np.r_[starts[1:], len(x)] - 1
+    counts = ends - starts + 1
+    keep = [starts, ends]
+    for reduce in [np.minimum, np.maximum]:
+        extreme = np.repeat(reduce.reduceat(y, starts), counts)
+        hits = np.flatnonzero(y == extreme)
+        keep.append(hits[np.r_[True, bucket[hits][1:] != bucket[hits][:-1]]])
+    return(np.unique(np.concatenate(keep)))
+
+def lttb_indices(x, y, max_points):
+    """
+    Function to choose samples by Largest-Triangle-Three-Buckets: the first
+    and last samples, and in each of `max_points` - 2 buckets the sample
+    forming the largest triangle with the previously chosen sample and the
+    mean of the next bucket.
+
+    Parameters
+    ----------
+    x : numpy array
+        sorted float sample times
+
+    y : numpy array
+        float sample values without NaNs
+
+    max_points : int
+        samples to keep (at least 3)
+
+    Returns
+    -------
+    indices : numpy array
+        sorted indices
+    """
+    n = len(x)
+    max_points = max(max_points, 3)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    indices = np.zeros(max_points, dtype=np.int64)
+    indices[-1] = n - 1
+    previous = 0
+    for b in range(max_points - 2):
+        low, high = edges[b], max(edges[b + 1], edges[b] + 1)
+        next_low, next_high = edges[b + 1], edges[b + 2] if b + 2 < len(
+                              edges) else n
+        next_x = x[next_low:max(next_high, next_low + 1)].mean()
+        next_y = y[next_low:max(next_high, next_low + 1)].mean()
+        area = np.abs((x[previous] - next_x) * (y[low:high] - y[previous]) -
+               (x[previous] - x[low:high]) * (next_y - y[previous]))
+        previous = low + int(np.argmax(area))
+        indices[b + 1] = previous
+    return(indices)
+
+# ============================================================================
+if __name__ == '__main__':
+    main()
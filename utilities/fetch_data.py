@@ -11,8 +11,33 @@ Copyright 2016,  Mindboggle team (http://mindboggle.info), Apache v2.0 License
 
 """
 from config import config
-from datetime import timedelta
-import pandas as pd
+from utilities.align_data import align_devices, device_offsets
+from utilities.organize_wearable_data import load_df
+from utilities.store_data import load_store, store_meta, write_store
+import hashlib, json, os, shutil, tempfile, threading, time, urllib.error, \
+       urllib.request
+# persistent download cache, keyed by URL (OSF URLs include the file version)
+cache_directory = os.environ.get('HBN_WEARABLE_CACHE', os.path.join(
+                  os.path.expanduser('~'), '.cache', 'HBN-wearable-analysis'))
+# largest total size of cached downloads in bytes before least recently used
+# files are evicted
+cache_size_limit = int(os.environ.get('HBN_WEARABLE_CACHE_SIZE', 50 * 2 ** 30))
+# hash algorithm naming cached files: any hashlib algorithm, or 'xxh64' /
+# 'xxh3_128' if the xxhash package is installed ('blake2b' is faster than
+# 'md5' in pure software; 'sha256' is faster on CPUs with SHA extensions)
+cache_algorithm = 'sha256'
+# bytes to read, write and hash at a time
+block_size = 1048576
+# seconds a download may stall before it is dropped and resumed
+download_timeout = 60
+# only serve cached downloads, never touch the network (HBN_WEARABLE_OFFLINE
+# set to 1, true or yes)
+offline = os.environ.get('HBN_WEARABLE_OFFLINE', '').strip().lower() in ('1',
+          'true', 'yes')
+# guards the cache index across threads
+cache_lock = threading.Lock()
+# one lock per URL being fetched, so threads never share a partial download
+download_locks = {}
 
 def cache_hashes():
     """
@@ -54,7 +79,8 @@ def cache_hashes():
     return hashes
 
 
-def df_devices(devices, sensor, start=None, stop=None):
+def df_devices(devices, sensor, start=None, stop=None, offsets=None,
+               tolerance=None, columns=None):
     """
     Function to build a pandas dataframe from a set of csv files
     with urls stored in config/config.py.
@@ -72,37 +98,65 @@ def df_devices(devices, sensor, start=None, stop=None):
         
     stop : datetime, optional
         end of time to compare
+
+    offsets : dictionary, optional
+        timedelta to add to each device's timestamps, by device (default:
+        align_data.device_offsets)
+
+    tolerance : timedelta, optional
+        largest difference between aligned timestamps (default: exact)
+
+    columns : list of strings, optional
+        value columns to load (default: all)
         
     Returns
     -------
     df : pandas dataframe
         merged dataframe with a column per device
     """
-    suffix = '.csv'
+    offsets = device_offsets if offsets is None else offsets
     s = []
     for i, device in enumerate(devices):
         device_suffix = device.replace(" ", "_")
-        d = pd.read_csv(fetch_data(config.rawurls[
-            sensor][device]), parse_dates=['Timestamp'],
-            infer_datetime_format=True)
-        start = min(d['Timestamp']) if not start else start
-        stop = max(d['Timestamp']) if not stop else stop
-        d = d.loc[(d['Timestamp'] >= start) & (d['Timestamp'] <=
-               stop)].copy()
-        if device == 'ActiGraph wGT3X-BT':
-            d[['Timestamp']] = d.Timestamp.apply(lambda x: x - 
-                                  timedelta(microseconds=1000))
-        d.set_index('Timestamp', inplace=True)
-        for c in d.columns:
-            d.rename(columns={c: "_".join([c, device_suffix])}, inplace=True)
+        d = load_store(fetch_store(sensor, device), start, stop, columns)
+        d = d.set_index('Timestamp')
+        d.columns = ["_".join([c, device_suffix]) for c in d.columns]
         s.append(d)
-        
-    df = s[0].merge(s[1], left_index=True, right_index=True, suffixes=(''.join(
-         ['_', devices[0]]), ''.join(['_', devices[1]])))
-    for i in range(2, len(s), 1):
-        df = df.merge(s[i], left_index=True, right_index=True, suffixes=('',
-             ''.join(['_', devices[i][1]])))
-    return(df)
+    return(align_devices(s, [offsets.get(device) for device in devices],
+           tolerance))
+
+
+def fetch_store(sensor, device, cache_dir=None):
+    """
+    Function to get the path of a time-indexed store (see store_data.py) of
+    a device's organized data from the url in config/config.py. The store
+    sits beside the cached download it was built from and is named by that
+    download's content hash, so it is rebuilt when the url's content
+    changes and evicted along with the download (see evict_cache()).
+
+    Parameters
+    ----------
+    sensor : string
+        the sensor
+
+    device : string
+        the device
+
+    cache_dir : string or None
+        download cache directory (default=None, i.e. `cache_directory`)
+
+    Returns
+    -------
+    store_dir : string
+        path to store directory, `cache_dir`/objects/`content hash`.store
+    """
+    url = config.rawurls[sensor][device]
+    data_path = cached_fetch(url, cache_dir=cache_dir)
+    store_dir = cache_store(data_path)
+    if not store_meta(store_dir):
+        print(' : '.join(['Building store', sensor, device]))
+        write_store(load_df(data_path), store_dir, url)
+    return(store_dir)
 
 
 def test_urls():
@@ -385,7 +439,7 @@ def prep_tests():
     return urls, fetch_data
 
 
-def fetch_hash(data_file):
+def fetch_hash(data_file, algorithm='md5'):
     """
     Get hash of data file.
 
@@ -393,6 +447,8 @@ def fetch_hash(data_file):
     ----------
     data_file : string
         data file name
+    algorithm : string
+        hash algorithm (see new_hash())
 
     Returns
     -------
@@ -409,22 +465,22 @@ def fetch_hash(data_file):
     'f36e3d5d99f7c4a9bb70e2494ed7340b'
 
     """
-    from io import open
-
-    import hashlib
-
-    # Compute the file's hash:
-    hash = hashlib.md5(open(data_file, 'rb').read()).hexdigest()
+    # Compute the file's hash in fixed-size blocks:
+    hash = file_hash(data_file, algorithm)
 
     return hash
 
 
-def fetch_data(url, output_file='', append=''):
+def fetch_data(url, output_file='', append='', cache=True):
     """
     Download file from a URL to a specified or a temporary file.
 
     Optionally append to file name.
 
+    Unless `cache` is False, the file comes from the persistent download
+    cache (see cached_fetch()), downloading it only on a cache miss; without
+    an output file, the cached file's path is returned.
+
     Parameters
     ----------
     url : string
@@ -433,6 +489,8 @@ def fetch_data(url, output_file='', append=''):
         name of output file (full path)
     append : string
         append to output file (ex: '.nii.gz')
+    cache : bool
+        use the download cache?
 
     Returns
     -------
@@ -451,10 +509,20 @@ def fetch_data(url, output_file='', append=''):
     'f36e3d5d99f7c4a9bb70e2494ed7340b'
 
     """
-    import os
-    import urllib.request
-
-    output_file, foo = urllib.request.urlretrieve(url, output_file)
+    if cache:
+        cached_file = cached_fetch(url)
+        if not output_file and not append:
+            return cached_file
+        # copy, so changes to the output file never reach the cache
+        if not output_file:
+            handle, output_file = tempfile.mkstemp()
+            os.close(handle)
+        shutil.copyfile(cached_file, output_file)
+    else:
+        if not output_file:
+            handle, output_file = tempfile.mkstemp()
+            os.close(handle)
+        download_file(url, output_file)
 
     # Add append if assigned:
     if append:
@@ -464,15 +532,477 @@ def fetch_data(url, output_file='', append=''):
     return output_file
 
 
+def prefetch(sensors=None, devices=None, max_workers=8, retries=3,
+             backoff=1.0, ignore_errors=False):
+    """
+    Function to download the files for a selection of config.rawurls at the
+    same time into the download cache through a bounded thread pool.
+
+    Parameters
+    ----------
+    sensors : string or list of strings or None
+        sensor(s) to fetch (default=None, i.e. all sensors)
+
+    devices : list of strings or None
+        devices to fetch (default=None, i.e. all devices)
+
+    max_workers : int
+        most downloads at once (default=8)
+
+    retries : int
+        further attempts per file after a failure (default=3)
+
+    backoff : float
+        seconds to wait before the first retry, doubling for each further
+        retry (default=1.0)
+
+    ignore_errors : boolean
+        leave files that still fail as None instead of raising an IOError
+        once every other file is done (default=False)
+
+    Returns
+    -------
+    data : dictionary
+        path to each cached file by device by sensor
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    jobs = [(sensor, device, url) for sensor, urls in config.raw_urls(
+            sensors).items() for device, url in urls.items() if not devices
+            or device in devices]
+    data = {}
+    for sensor, device, url in jobs:
+        data.setdefault(sensor, {})[device] = None
+    failed = []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(fetch_retry, url, retries, backoff): (sensor,
+                   device) for sensor, device, url in jobs}
+        for done, future in enumerate(as_completed(futures), 1):
+            sensor, device = futures[future]
+            try:
+                data[sensor][device] = future.result()
+                status = 'fetched'
+            except OSError as e:
+                failed.append((sensor, device, e))
+                status = ' '.join(['failed:', str(e)])
+            print(' : '.join([''.join(['[', str(done), '/', str(len(futures)),
+                  ']']), sensor, device, status]))
+    if failed and not ignore_errors:
+        raise IOError("Could not fetch {0}".format(", ".join([" ".join([
+                      sensor, device]) for sensor, device, e in failed])))
+    return data
+
+
+def fetch_retry(url, retries=3, backoff=1.0):
+    """
+    Function to get a file through the download cache, retrying failed
+    downloads with exponential backoff.
+
+    Parameters
+    ----------
+    url : string
+        URL for data file
+
+    retries : int
+        further attempts after a failure (default=3)
+
+    backoff : float
+        seconds to wait before the first retry, doubling for each further
+        retry (default=1.0)
+
+    Returns
+    -------
+    data_path : string
+        path to the cached file
+    """
+    for attempt in range(retries + 1):
+        try:
+            return cached_fetch(url)
+        except OSError:
+            if offline or attempt == retries:
+                raise
+            time.sleep(backoff * 2 ** attempt)
+
+
+def cached_fetch(url, expected_hash=None, algorithm=None, cache_dir=None,
+                 offline_mode=None, verify=False, limit=None):
+    """
+    Function to get a file through the persistent download cache. Files are
+    stored once per content hash under `cache_dir`/objects, and
+    `cache_dir`/index.json maps each URL to its content hash, size and last
+    use. Once the cache exceeds `limit`, least recently used files are
+    evicted.
+
+    Parameters
+    ----------
+    url : string
+        URL for data file; the cache is keyed by the full URL, so a new OSF
+        version is a new entry
+
+    expected_hash : string or None
+        hex digest the content must have (default=None, i.e. any)
+
+    algorithm : string or None
+        hash algorithm of `expected_hash` and of new cached files (see
+        new_hash(); default=None, i.e. `cache_algorithm`)
+
+    cache_dir : string or None
+        cache directory (default=None, i.e. `cache_directory`)
+
+    offline_mode : boolean or None
+        raise an IOError instead of downloading on a cache miss
+        (default=None, i.e. `offline`)
+
+    verify : boolean
+        rehash a cached file before serving it (default=False, i.e. only
+        check its size)
+
+    limit : int or None
+        largest total size of the cache in bytes (default=None, i.e.
+        `cache_size_limit`)
+
+    Returns
+    -------
+    data_path : string
+        path to the cached file
+    """
+    cache_dir = cache_dir if cache_dir else cache_directory
+    algorithm = algorithm if algorithm else cache_algorithm
+    offline_mode = offline if offline_mode is None else offline_mode
+    with cache_lock:
+        url_lock = download_locks.setdefault(url, threading.Lock())
+    with url_lock:
+        with cache_lock:
+            index = load_cache_index(cache_dir)
+            entry = index.get(url)
+            if entry and os.path.exists(cache_object(cache_dir, entry[
+               'hash'])):
+                data_path = cache_object(cache_dir, entry['hash'])
+                entry_algorithm = entry.get('algorithm', 'sha256')
+                if os.path.getsize(data_path) == entry['size'] and (not
+                   verify or file_hash(data_path, entry_algorithm) == entry[
+                   'hash']) and (not expected_hash or expected_hash == (entry[
+                   'hash'] if entry_algorithm == algorithm else file_hash(
+                   data_path, algorithm))):
+                    entry['used'] = time.time()
+                    save_cache_index(cache_dir, index)
+                    return data_path
+        if offline_mode:
+            raise IOError("Offline and not in download cache: {0}".format(
+                          url))
+        os.makedirs(os.path.join(cache_dir, 'objects'), exist_ok=True)
+        # named by URL, so an interrupted download resumes on the next call
+        temp_file = os.path.join(cache_dir, 'objects', '.'.join([
+                    hashlib.sha256(url.encode('utf-8')).hexdigest(),
+                    'download']))
+        data_hash = download_file(url, temp_file, algorithm)
+        if expected_hash and data_hash != expected_hash:
+            os.remove(temp_file)
+            raise IOError("Retrieved hash does not match stored hash.")
+        data_path = cache_object(cache_dir, data_hash)
+        os.replace(temp_file, data_path)
+        with cache_lock:
+            index = load_cache_index(cache_dir)
+            index[url] = {'hash': data_hash, 'algorithm': algorithm, 'size':
+                          os.path.getsize(data_path), 'used': time.time()}
+            evict_cache(cache_dir, index, cache_size_limit if limit is None
+                        else limit, data_hash)
+            save_cache_index(cache_dir, index)
+    return data_path
+
+
+def download_file(url, output_file, algorithm=None, retries=5, timeout=None,
+                  backoff=1.0):
+    """
+    Function to download a file in fixed-size blocks, hashing each block as
+    it arrives, so the file is read from the network and written to disk
+    once and never read back to verify it.
+
+    Bytes go to `output_file`.part, with the URL, validators (ETag /
+    Last-Modified) and total length in `output_file`.part.json. If the
+    connection drops or stalls for `timeout` seconds, or an earlier call was
+    interrupted, the download resumes from the end of the partial file with
+    an HTTP Range request after an exponential backoff (If-Range guards
+    against the file having changed on the server); a server that answers
+    with the whole file, or that the range is not satisfiable (416),
+    restarts it. The complete file is renamed to `output_file`.
+
+    Parameters
+    ----------
+    url : string
+        URL for data file
+
+    output_file : string
+        path to write to
+
+    algorithm : string or None
+        hash algorithm (see new_hash(); default=None, i.e. `cache_algorithm`)
+
+    retries : int
+        resumes to attempt after dropped connections (default=5)
+
+    timeout : float or None
+        seconds to wait to connect or for more data before dropping the
+        connection (default=None, i.e. `download_timeout`)
+
+    backoff : float
+        seconds to wait before the first resume, doubling for each further
+        resume (default=1.0)
+
+    Returns
+    -------
+    hash : string
+        hex digest of the downloaded file
+    """
+    import http.client
+
+    part_file = '.'.join([output_file, 'part'])
+    meta_file = '.'.join([part_file, 'json'])
+    h = new_hash(algorithm if algorithm else cache_algorithm)
+    meta = {}
+    if os.path.exists(part_file) and os.path.exists(meta_file):
+        with open(meta_file) as fp:
+            meta = json.load(fp)
+        if meta.get('url') != url:
+            meta = {}
+    offset = 0
+    if meta:
+        # the hash state is not saved, so rehash what is already on disk
+        with open(part_file, 'rb') as fp:
+            for block in iter(lambda: fp.read(block_size), b''):
+                h.update(block)
+                offset += len(block)
+    attempt = 0
+    while meta.get('length') is None or offset < meta['length']:
+        request = urllib.request.Request(url)
+        if offset:
+            request.add_header('Range', 'bytes={0}-'.format(offset))
+            validator = meta.get('etag') or meta.get('last_modified')
+            if validator:
+                request.add_header('If-Range', validator)
+        try:
+            with urllib.request.urlopen(request, timeout=timeout if timeout
+                                        else download_timeout) as response:
+                if offset and response.status != 206:
+                    offset = 0
+                    h = new_hash(algorithm if algorithm else cache_algorithm)
+                if not offset:
+                    length = response.headers.get('Content-Length')
+                    meta = {'url': url, 'etag': response.headers.get('ETag'),
+                            'last_modified': response.headers.get(
+                            'Last-Modified'), 'length': int(length) if length
+                            else None}
+                    with open(meta_file, 'w') as fp:
+                        json.dump(meta, fp)
+                with open(part_file, 'ab' if offset else 'wb') as fp:
+                    for block in iter(lambda: response.read(block_size), b''):
+                        h.update(block)
+                        fp.write(block)
+                        offset += len(block)
+            if meta['length'] is None:
+                break
+            if offset < meta['length']:
+                raise http.client.IncompleteRead(b'', meta['length'] - offset)
+        except urllib.error.HTTPError as e:
+            if attempt >= retries or e.code < 500 and not (e.code == 416 and
+               offset):
+                raise
+            attempt += 1
+            if e.code == 416:
+                # the partial file is longer than the file on the server now
+                offset = 0
+                meta = {}
+                h = new_hash(algorithm if algorithm else cache_algorithm)
+            else:
+                time.sleep(backoff * 2 ** (attempt - 1))
+        except (OSError, http.client.HTTPException):
+            if attempt >= retries:
+                raise
+            attempt += 1
+            print(' : '.join(['Resuming download', url, ' '.join([str(offset),
+                  'bytes'])]))
+            time.sleep(backoff * 2 ** (attempt - 1))
+    os.replace(part_file, output_file)
+    os.remove(meta_file)
+    return h.hexdigest()
+
+
+def new_hash(algorithm):
+    """
+    Function to start a hash.
+
+    Parameters
+    ----------
+    algorithm : string
+        any hashlib algorithm (e.g. 'md5', 'sha256', 'blake2b'), or 'xxh64',
+        'xxh3_64' or 'xxh3_128' with the xxhash package installed
+
+    Returns
+    -------
+    h : hash object
+        object with update() and hexdigest() methods
+    """
+    if algorithm.startswith('xxh'):
+        import xxhash
+        return getattr(xxhash, algorithm)()
+    return hashlib.new(algorithm)
+
+
+def cache_object(cache_dir, data_hash):
+    """
+    Function to get the path of a cached file from its content hash.
+
+    Parameters
+    ----------
+    cache_dir : string
+        cache directory
+
+    data_hash : string
+        content hash
+
+    Returns
+    -------
+    data_path : string
+        `cache_dir`/objects/`data_hash`
+    """
+    return os.path.join(cache_dir, 'objects', data_hash)
+
+
+def cache_store(data_path):
+    """
+    Function to get the path of the store built from a cached file.
+
+    Parameters
+    ----------
+    data_path : string
+        path to cached file, from cache_object()
+
+    Returns
+    -------
+    store_dir : string
+        `data_path`.store
+    """
+    return '.'.join([data_path, 'store'])
+
+
+def load_cache_index(cache_dir):
+    """
+    Function to load the download cache index.
+
+    Parameters
+    ----------
+    cache_dir : string
+        cache directory
+
+    Returns
+    -------
+    index : dictionary
+        'hash', 'size' and 'used' (time of last use) by URL
+    """
+    index_file = os.path.join(cache_dir, 'index.json')
+    if not os.path.exists(index_file):
+        return {}
+    with open(index_file) as fp:
+        return json.load(fp)
+
+
+def save_cache_index(cache_dir, index):
+    """
+    Function to save the download cache index, replacing the old one
+    atomically.
+
+    Parameters
+    ----------
+    cache_dir : string
+        cache directory
+
+    index : dictionary
+        from load_cache_index()
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    index_file = os.path.join(cache_dir, 'index.json')
+    temp_file = '.'.join([index_file, str(os.getpid()), 'tmp'])
+    with open(temp_file, 'w') as fp:
+        json.dump(index, fp, indent=2)
+    os.replace(temp_file, index_file)
+
+
+def evict_cache(cache_dir, index, limit, keep=None):
+    """
+    Function to delete least recently used cached files, and any stores
+    built from them, until the cached files total no more than `limit`
+    bytes.
+
+    Parameters
+    ----------
+    cache_dir : string
+        cache directory
+
+    index : dictionary
+        from load_cache_index(); evicted URLs are removed in place
+
+    limit : int
+        largest total size in bytes
+
+    keep : string or None
+        content hash never to evict (default=None)
+    """
+    objects = {}
+    for url, entry in index.items():
+        objects.setdefault(entry['hash'], {'size': entry['size'], 'used': 0,
+                           'urls': []})
+        objects[entry['hash']]['used'] = max(objects[entry['hash']]['used'],
+                                         entry['used'])
+        objects[entry['hash']]['urls'].append(url)
+    total = sum(o['size'] for o in objects.values())
+    for data_hash, o in sorted(objects.items(), key=lambda h: h[1]['used']):
+        if total <= limit:
+            break
+        if data_hash == keep:
+            continue
+        if os.path.exists(cache_object(cache_dir, data_hash)):
+            os.remove(cache_object(cache_dir, data_hash))
+        if os.path.exists(cache_store(cache_object(cache_dir, data_hash))):
+            shutil.rmtree(cache_store(cache_object(cache_dir, data_hash)))
+        for url in o['urls']:
+            del index[url]
+        total -= o['size']
+
+
+def file_hash(data_file, algorithm=None):
+    """
+    Function to hash a file in constant memory, `block_size` bytes at a time.
+
+    Parameters
+    ----------
+    data_file : string
+        path to file
+
+    algorithm : string or None
+        hash algorithm (see new_hash(); default=None, i.e. `cache_algorithm`)
+
+    Returns
+    -------
+    hash : string
+        hex digest
+    """
+    h = new_hash(algorithm if algorithm else cache_algorithm)
+    with open(data_file, 'rb') as fp:
+        for block in iter(lambda: fp.read(block_size), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
 def fetch_check_data(data_file, url, hashes, cache_directory='', append='',
-                     verbose=False):
+                     verbose=False, algorithm='md5'):
     """
     Get data file through a URL call and check its hash:
 
         1. Check hash table for data file name.
         2. Check hash subdirectory within cache directory for data file.
-        3. If data file not in cache, download, compute hash, and verify hash.
-        4. If hash correct, save file (+ append); otherwise, raise an error.
+        3. If data file not in cache, download into the hash subdirectory
+           while computing its hash, and verify hash.
+        4. If hash correct, rename file into place (+ append); otherwise,
+           delete it and raise an error.
 
     Parameters
     ----------
@@ -488,6 +1018,8 @@ def fetch_check_data(data_file, url, hashes, cache_directory='', append='',
         append to output file (ex: '.nii.gz')
     verbose : bool
         print statements?
+    algorithm : string
+        hash algorithm of `hashes` (see new_hash())
 
     Returns
     -------
@@ -509,9 +1041,6 @@ def fetch_check_data(data_file, url, hashes, cache_directory='', append='',
     ...                              append, verbose) # doctest: +SKIP
 
     """
-    import os
-    import shutil
-
     # ------------------------------------------------------------------------
     # Set temporary cache directory if not specified:
     # ------------------------------------------------------------------------
@@ -554,11 +1083,10 @@ def fetch_check_data(data_file, url, hashes, cache_directory='', append='',
             if verbose:
                 print("Retrieve file from URL: {0}".format(url))
 
-            # Download file as a temporary file:
-            temp_file = fetch_data(url)
-
-            # Compute the file's hash:
-            data_hash = fetch_hash(temp_file)
+            # Download file as a temporary file in the hash directory,
+            # computing the file's hash as it streams in:
+            temp_file = '.'.join([data_path, 'download'])
+            data_hash = download_file(url, temp_file, algorithm)
 
             # If hash matches name of the hash directory, save file:
             if os.path.join(cache_directory, data_hash) == hash_dir:
@@ -566,10 +1094,11 @@ def fetch_check_data(data_file, url, hashes, cache_directory='', append='',
                 if append:
                     data_path += append
                 if verbose:
-                    print("Copy file to cache: {0}".format(data_path))
-                shutil.copyfile(temp_file, data_path)
+                    print("Move file into cache: {0}".format(data_path))
+                os.replace(temp_file, data_path)
                 return data_path
             else:
+                os.remove(temp_file)
                 raise IOError("Retrieved hash does not match stored hash.")
     else:
         raise IOError("Data file '{0}' not in hash table.".
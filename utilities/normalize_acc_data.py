@@ -14,7 +14,6 @@ Actigraphy values calculated as √((x/√((max(x))² + (max(y))² + (max(z))²)
 """
 
 from datetime import datetime, timedelta
-from dateutil import parser
 from math import sqrt
 import numpy as np, os, pandas as pd
 
@@ -32,7 +31,7 @@ def normalize(df, scale=None):
     Parameters
     ----------
     df : pandas dataframe
-        dataframe with ['x', 'y', 'z'] columns to normalize
+        dataframe with ['x', 'y', 'z'] columns to normalize; not modified
 
     scale : numeric or None
         maximum possible absolute value of dataframe's current scale
@@ -41,20 +40,109 @@ def normalize(df, scale=None):
     Returns
     -------
     df : pandas dataframe
-        dataframe with ['normalized_vector_length'] column added
+        new dataframe with ['normalized_vector_length'] column added
     """
-    cols = ['x', 'y', 'z']
-    if not scale:
-        scale = max([max(df[ax].max(), abs(df[ax].min())) for ax in cols])        
-    unit = np.float64(sqrt(3*(scale**2)))
-    try:
-        df['Timestamp'] = df['Timestamp'].map(parser.parse, 'ignore')
-    except:
-        pass
-    df['normalized_vector_length'] = np.sqrt((df['x'] / unit) ** 2 + (df['y'] /
-                                     unit) ** 2 + (df['z'] / unit) ** 2)
+    values = acc_values(df)
+    df = df.copy(deep=False)
+    if 'Timestamp' in df.columns and not \
+       pd.api.types.is_datetime64_any_dtype(df['Timestamp']):
+        try:
+            df['Timestamp'] = pd.to_datetime(df['Timestamp'])
+        except (TypeError, ValueError):
+            pass
+    df['normalized_vector_length'] = vector_length(values, scale)
     return(df)
 
+def normalize_chunks(chunks, scale=None):
+    """
+    Generator to calculate unit-cube normalized vector length over streamed
+    chunks in one pass (see normalize()).
+
+    Parameters
+    ----------
+    chunks : iterable of pandas dataframes
+        dataframes with ['x', 'y', 'z'] columns, e.g. from
+        organize_wearable_data.load_df() chunks or read_geneactiv_bin.read_bin()
+
+    scale : numeric or None
+        maximum possible absolute value of the data's scale (e.g. the
+        device's range in g); if None, the running maximum absolute value
+        seen so far is used, which only matches normalize() on the whole
+        file once the global maximum has been reached
+
+    Yields
+    ------
+    df : pandas dataframe
+        new dataframe with ['normalized_vector_length'] column added
+    """
+    running = 0
+    for chunk in chunks:
+        values = acc_values(chunk)
+        if not scale:
+            running = max(running, acc_scale(values))
+        df = chunk.copy(deep=False)
+        df['normalized_vector_length'] = vector_length(values, scale if scale
+                                         else running)
+        yield(df)
+
+def acc_values(df):
+    """
+    Function to get accelerometer axes as one float32 (N, 3) array.
+
+    Parameters
+    ----------
+    df : pandas dataframe
+        dataframe with ['x', 'y', 'z'] columns
+
+    Returns
+    -------
+    values : numpy array
+        float32 array of shape (N, 3)
+    """
+    return(np.ascontiguousarray(df[axes].values, dtype=np.float32))
+
+def acc_scale(values):
+    """
+    Function to get the maximum absolute value of accelerometer data.
+
+    Parameters
+    ----------
+    values : numpy array
+        (N, 3) array
+
+    Returns
+    -------
+    scale : float
+        max(|x|, |y|, |z|), ignoring NaNs (0.0 if there are no values)
+    """
+    if not len(values) or np.isnan(values).all():
+        return(0.0)
+    return(float(max(np.nanmax(values), -np.nanmin(values))))
+
+def vector_length(values, scale=None):
+    """
+    Function to calculate vector length normalized to a unit cube from an
+    (N, 3) array, i.e. √(x² + y² + z²) / √(3 × scale²).
+
+    Parameters
+    ----------
+    values : numpy array
+        float32 (N, 3) array of x, y, z
+
+    scale : numeric or None
+        maximum possible absolute value of the data's scale
+        if None, calculated from data
+
+    Returns
+    -------
+    lengths : numpy array
+        float32 array of N normalized vector lengths
+    """
+    if not scale:
+        scale = acc_scale(values)
+    unit = np.float32(sqrt(3 * (scale ** 2)))
+    return(np.sqrt(np.einsum('ij,ij->i', values, values)) / unit)
+
 # ============================================================================
 if __name__ == '__main__':
     main()
\ No newline at end of file
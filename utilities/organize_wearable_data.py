@@ -11,16 +11,25 @@ Created on Fri Apr 7 17:27:05 2017
 
 @author: jon.clucas
 """
-from datetime import datetime, timedelta
-import numpy as np, os, pandas as pd
+from datetime import datetime, timedelta, timezone
+from utilities.calibrate_acc_data import calibrated_bin
+from utilities.read_geneactiv_bin import page_samples, read_bin
+from utilities.store_data import load_store, write_store
+import json, numpy as np, os, pandas as pd
 axes = ['x', 'y', 'z']
+# rows per chunk when streaming source csv files
+csv_chunk_rows = 1000000
+# default file format for save_df(): 'csv', 'parquet', 'feather', 'npz' or
+# 'store'
+organized_format = 'csv'
 
 """
 --------------------------------
 Actigraph wGT3X-BT with Polar H7
 --------------------------------
 """
-def actigraph_acc(dirpath):
+def actigraph_acc(dirpath, on_disk=False, processes=None,
+                  incremental=False):
     """
     Function to take all Actigraph accelerometry data from a directory and
     format those data with Linux time-series index columns and x, y, z value
@@ -31,6 +40,18 @@ def actigraph_acc(dirpath):
     dirpath : string
         path to E4 outputs
 
+    on_disk : boolean
+        append each file's data to the organized csv as it is parsed instead
+        of combining all files in memory (default=False)
+
+    processes : int or None
+        number of worker processes to parse files with; files are parsed one
+        at a time in this process if None or 1 (default=None)
+
+    incremental : boolean
+        only parse files that are new or changed since the last run and merge
+        their rows into the existing organized data (default=False)
+
     Returns
     -------
     acc_data : pandas dataframe
@@ -42,28 +63,45 @@ def actigraph_acc(dirpath):
         comma-separated-values file with Linux time-series index column and x,
         y, z accelerometer value columns
     """
-    acc_data = pd.DataFrame
-    for acc in os.listdir(dirpath):
+    acc_data = Accumulator('accelerometer', 'Actigraph', on_disk, processes,
+               incremental)
+    for acc in sorted(os.listdir(dirpath)):
         if acc.endswith("1sec.csv"):
-            if acc_data.empty:
-                with open(os.path.join(dirpath, acc), 'r') as acc_f:
-                    acc_data = actigraph_acc_data(acc_f)
-            else:
-                with open(os.path.join(dirpath, acc), 'r') as acc_f:
-                    acc_data = pd.concat([acc_data, actigraph_acc_data(acc_f)])
-            print(' : '.join(['Actigraph accelorometer data, adding', acc, str(
-                  acc_data.shape)]))
-    save_df(acc_data, 'accelerometer', 'Actigraph')
+            acc_data.add_file(os.path.join(dirpath, acc), actigraph_acc_data,
+                              acc_data.chunk_rows)
+    return(acc_data.save())
 
-def actigraph_acc_data(open_csv):
+def actigraph_acc_data(open_csv, chunk_rows=None):
     """
     Function to collect Actigraph data and return dataframe with Linux time-
     series index column and x, y, z value columns
 
+    Parameters
+    ----------
+    open_csv : open csv file or string
+        an open Actigraph csv file or the path to one
+
+    chunk_rows : int or None
+        if given, stream the file and yield dataframes of at most this many
+        rows instead of returning one dataframe (default=None)
+
+    Returns
+    -------
+    new_df : pandas dataframe or generator of pandas dataframes
+        dataframe with Linux time-series index column and accelerometer value
+        columns
+    """
+    return(organize_chunks(drop_non_csv_chunks(open_csv, 10, True,
+           chunk_rows), actigraph_acc_chunk, chunk_rows))
+
+def actigraph_acc_chunk(df):
+    """
+    Function to organize one chunk of an Actigraph csv file
+
     Parameters
     ----------
     df : pandas dataframe
-        dataframe for which to organize data
+        typed chunk from drop_non_csv_chunks()
 
     Returns
     -------
@@ -71,17 +109,12 @@ def actigraph_acc_data(open_csv):
         dataframe with Linux time-series index column and accelerometer value
         columns
     """
-
-    df = drop_non_csv(open_csv, 10, True)
-    df['timestamp'] = df['timestamp'].map(actigraph_datetimeint)
-    new_df = pd.DataFrame()
-    new_df[['Timestamp', 'x', 'y', 'z']] = df[['timestamp', 'axis1', 'axis2',
-                                           'axis3']]
-    new_df.set_index('Timestamp', inplace=True)
+    new_df = df[['axis1', 'axis2', 'axis3']].astype(np.float64)
+    new_df.columns = axes
+    new_df.index = pd.Index(actigraph_datetimearray(df['timestamp']),
+                   name='Timestamp')
     # convert from 1/512g to g
-    for axis in axes:
-        new_df[axis] = new_df[axis].map(lambda x: float(x)/512)
-    return(new_df)
+    return(new_df / 512)
 
 def actigraph_datetimeint(x):
     """
@@ -101,7 +134,26 @@ def actigraph_datetimeint(x):
     dt_format='%Y-%m-%d %H:%M:%S'
     return(datetimeint(x, dt_format))
 
-def actigraph_1c(dirpath, feature):
+def actigraph_datetimearray(x):
+    """
+    Function to pass dt_format parameter to datetimearray(x, dt_format) for
+    a column of Actigraph data
+
+    Parameters
+    ----------
+    x : array-like of strings
+        timestamp data from Actigraph
+
+    Returns
+    -------
+    timestamps : numpy array
+        datetime64[ns] array (from datetimearray)
+    """
+    dt_format='%Y-%m-%d %H:%M:%S'
+    return(datetimearray(x, dt_format))
+
+def actigraph_1c(dirpath, feature, on_disk=False, processes=None,
+                 incremental=False):
     """
     Function to take all Actigraph accelerometry data from a directory and
     format those data with Linux time-series index columns and x, y, z value
@@ -112,6 +164,18 @@ def actigraph_1c(dirpath, feature):
     dirpath : string
         path to E4 outputs
 
+    on_disk : boolean
+        append each file's data to the organized csv as it is parsed instead
+        of combining all files in memory (default=False)
+
+    processes : int or None
+        number of worker processes to parse files with; files are parsed one
+        at a time in this process if None or 1 (default=None)
+
+    incremental : boolean
+        only parse files that are new or changed since the last run and merge
+        their rows into the existing organized data (default=False)
+
     Returns
     -------
     acc_data : pandas dataframe
@@ -124,35 +188,49 @@ def actigraph_1c(dirpath, feature):
         y, z accelerometer value columns
     """
     sensors = {'lux':'light', 'hr':'heartrate'}
-    acc_data = pd.DataFrame
-    for acc in os.listdir(dirpath):
+    acc_data = Accumulator(sensors[feature], 'Actigraph', on_disk, processes,
+               incremental)
+    for acc in sorted(os.listdir(dirpath)):
         if acc.endswith("1sec.csv"):
-            if acc_data.empty:
-                with open(os.path.join(dirpath, acc), 'r') as acc_f:
-                    try:
-                        acc_data = actigraph_1c_data(acc_f, feature)
-                    except:
-                        pass
-            else:
-                with open(os.path.join(dirpath, acc), 'r') as acc_f:
-                    try:
-                        acc_data = pd.concat([acc_data, actigraph_1c_data(
-                                   acc_f, feature)])
-                    except:
-                        pass
-            print(' : '.join([' '.join(['Actigraph', sensors[feature] ,
-                  'data, adding']), acc, str(acc_data.shape)]))
-    save_df(acc_data, sensors[feature], 'Actigraph')
-
-def actigraph_1c_data(open_csv, feature):
+            acc_data.add_file(os.path.join(dirpath, acc), actigraph_1c_data,
+                              feature, acc_data.chunk_rows, ignore_errors=True)
+    return(acc_data.save())
+
+def actigraph_1c_data(open_csv, feature, chunk_rows=None):
     """
     Function to collect Actigraph data and return dataframe with Linux time-
     series index column and feature value columns
 
+    Parameters
+    ----------
+    open_csv : open csv file or string
+        an open Actigraph csv file or the path to one
+
+    feature : string
+        the column name in the source file for the feature we want to look at
+
+    chunk_rows : int or None
+        if given, stream the file and yield dataframes of at most this many
+        rows instead of returning one dataframe (default=None)
+
+    Returns
+    -------
+    new_df : pandas dataframe or generator of pandas dataframes
+        dataframe with Linux time-series index column and feature value
+        columns
+    """
+    return(organize_chunks(drop_non_csv_chunks(open_csv, 10, True,
+           chunk_rows), lambda df: actigraph_1c_chunk(df, feature),
+           chunk_rows))
+
+def actigraph_1c_chunk(df, feature):
+    """
+    Function to organize one chunk of an Actigraph csv file
+
     Parameters
     ----------
     df : pandas dataframe
-        dataframe for which to organize data
+        typed chunk from drop_non_csv_chunks()
 
     feature : string
         the column name in the source file for the feature we want to look at
@@ -163,12 +241,9 @@ def actigraph_1c_data(open_csv, feature):
         dataframe with Linux time-series index column and feature value
         columns
     """
-
-    df = drop_non_csv(open_csv, 10, True)
-    df['timestamp'] = df['timestamp'].map(actigraph_datetimeint)
-    new_df = pd.DataFrame()
-    new_df[['Timestamp', feature]] = df[['timestamp', feature]]
-    new_df.set_index('Timestamp', inplace=True)
+    new_df = df[[feature]].copy()
+    new_df.index = pd.Index(actigraph_datetimearray(df['timestamp']),
+                   name='Timestamp')
     return(new_df)
 
 """
@@ -176,7 +251,7 @@ def actigraph_1c_data(open_csv, feature):
 Empatica E4
 -----------
 """
-def e4_acc(dirpath):
+def e4_acc(dirpath, on_disk=False, processes=None, incremental=False):
     """
     Function to take all e4 accelerometry data from a directory and format
     those data with Linux time-series index column and x, y, z value columns
@@ -186,6 +261,18 @@ def e4_acc(dirpath):
     dirpath : string
         path to E4 outputs
 
+    on_disk : boolean
+        append each file's data to the organized csv as it is parsed instead
+        of combining all files in memory (default=False)
+
+    processes : int or None
+        number of worker processes to parse files with; files are parsed one
+        at a time in this process if None or 1 (default=None)
+
+    incremental : boolean
+        only parse files that are new or changed since the last run and merge
+        their rows into the existing organized data (default=False)
+
     Returns
     -------
     acc_data : pandas dataframe
@@ -197,29 +284,17 @@ def e4_acc(dirpath):
         comma-separated-values file with Linux time-series index column and x,
         y, z accelerometer value columns
     """
-    acc_data = pd.DataFrame()
-    for d in os.listdir(dirpath):
+    acc_data = Accumulator('accelerometer', 'E4', on_disk, processes,
+               incremental)
+    for d in sorted(os.listdir(dirpath)):
         d = os.path.join(dirpath, d)
         if os.path.isdir(d):
-            for acc in os.listdir(d):
+            for acc in sorted(os.listdir(d)):
                 if "ACC" in acc and acc.endswith("csv"):
-                    if acc_data.empty:
-                        acc_data = e4_timestamp(pd.read_csv(os.path.join(
-                                   dirpath, d, acc),
-                                   names=axes, index_col=False))
-                        print(' : '.join([acc, str(acc_data.shape)]))
-                    else:
-                        acc_data = pd.concat([acc_data, e4_timestamp(
-                                   pd.read_csv(os.path.join(dirpath, d, acc),
-                                   names=axes, index_col=False))])
-                    print(' : '.join(['E4 accelorometer data, adding',  acc, str(
-                          acc_data.shape)]))
-    # convert from 1/64g to g
-    for axis in axes:
-        acc_data[axis] = acc_data[axis].map(lambda x: float(x)/64)
-    save_df(acc_data, 'accelerometer', 'E4')
+                    acc_data.add_file(os.path.join(d, acc), e4_acc_data)
+    return(acc_data.save())
 
-def e4_ppg(dirpath):
+def e4_ppg(dirpath, on_disk=False, processes=None, incremental=False):
     """
     Function to take all e4 PPG data from a directory and format those data
     with Linux time-series index columns and nanowatt value columns
@@ -229,6 +304,18 @@ def e4_ppg(dirpath):
     dirpath : string
         path to E4 outputs
 
+    on_disk : boolean
+        append each file's data to the organized csv as it is parsed instead
+        of combining all files in memory (default=False)
+
+    processes : int or None
+        number of worker processes to parse files with; files are parsed one
+        at a time in this process if None or 1 (default=None)
+
+    incremental : boolean
+        only parse files that are new or changed since the last run and merge
+        their rows into the existing organized data (default=False)
+
     Returns
     -------
     ppg_data : pandas dataframe
@@ -240,25 +327,15 @@ def e4_ppg(dirpath):
         comma-separated-values file with Linux time-series index column and
         nanowatt value column
     """
-    ppg_data = pd.DataFrame()
-    for d in os.listdir(dirpath):
+    ppg_data = Accumulator('photoplethysmograph', 'E4', on_disk, processes,
+               incremental)
+    for d in sorted(os.listdir(dirpath)):
         d = os.path.join(dirpath, d)
         if os.path.isdir(d):
-            for ppg in os.listdir(d):
+            for ppg in sorted(os.listdir(d)):
                 if "BVP" in ppg and ppg.endswith("csv"):
-                    if ppg_data.empty:
-                        ppg_data = e4_timestamp(pd.read_csv(os.path.join(
-                                   dirpath, d, ppg), names=['nW'], index_col=
-                                   False))
-                        print(' : '.join([ppg, str(ppg_data.shape)]))
-                    else:
-                        ppg_data = pd.concat([ppg_data, e4_timestamp(
-                                   pd.read_csv(
-                                   os.path.join(dirpath, d, ppg), names=['nW'],
-                                   index_col=False))])
-                    print(' : '.join(['E4 photoplethysmograph data, adding',
-                          ppg, str(ppg_data.shape)]))
-    save_df(ppg_data, 'photoplethysmograph', 'E4')
+                    ppg_data.add_file(os.path.join(d, ppg), e4_1c_data, 'nW')
+    return(ppg_data.save())
 
 
 def e4_timestamp(df):
@@ -274,21 +351,19 @@ def e4_timestamp(df):
     Returns
     -------
     new_df : pandas dataframe
-        dataframe with Linux time-series index column and sensor-specific value
+        dataframe with datetime64 time-series index column (one timestamp per
+        sample, starting at the header start time) and sensor-specific value
         columns
     """
     start_time = float(df.iloc[0,0])
     sample_rate = float(df.iloc[1,0])
     new_df = df[2:].copy()
-    new_index = np.linspace(start=start_time, stop=len(new_df)*(1/sample_rate)+
-                start_time, num=len(new_df)+1)
-    new_df['Timestamp'] = pd.Series(new_index).apply(lambda x:
-                          datetime.fromtimestamp(float(x)).strftime(
-                          "%Y-%m-%d %H:%M:%S.%f"))
-    new_df.set_index('Timestamp', inplace=True)
+    new_df.index = pd.Index(fromtimestamp_array(start_time + np.arange(len(
+                   new_df)) / sample_rate), name='Timestamp')
     return(new_df)
 
-def e4_1c(dirpath, feature):
+def e4_1c(dirpath, feature, on_disk=False, processes=None,
+          incremental=False):
     """
     Function to take all e4 accelerometry data from a directory and format
     those data with Linux time-series index column and feature value column
@@ -301,6 +376,18 @@ def e4_1c(dirpath, feature):
     feature : string
         the column name in the source file for the feature we want to look at
 
+    on_disk : boolean
+        append each file's data to the organized csv as it is parsed instead
+        of combining all files in memory (default=False)
+
+    processes : int or None
+        number of worker processes to parse files with; files are parsed one
+        at a time in this process if None or 1 (default=None)
+
+    incremental : boolean
+        only parse files that are new or changed since the last run and merge
+        their rows into the existing organized data (default=False)
+
     Returns
     -------
     acc_data : pandas dataframe
@@ -313,25 +400,57 @@ def e4_1c(dirpath, feature):
         feature value columns
     """
     sensors = {'HR':'heartrate', 'TEMP':'temperature', 'EDA':'EDA'}
-    feat_data = pd.DataFrame()
-    for d in os.listdir(dirpath):
+    feat_data = Accumulator(sensors[feature], 'E4', on_disk, processes,
+                incremental)
+    for d in sorted(os.listdir(dirpath)):
         d = os.path.join(dirpath, d)
         if os.path.isdir(d):
-            for feat_file in os.listdir(d):
+            for feat_file in sorted(os.listdir(d)):
                 if feature in feat_file and feat_file.endswith("csv"):
-                    if feat_data.empty:
-                        feat_data = e4_timestamp(pd.read_csv(os.path.join(
-                                    dirpath, d, feat_file), names=[sensors[
-                                    feature]], index_col=False))
-                        print(' : '.join([feat_file, str(feat_data.shape)]))
-                    else:
-                        feat_data = pd.concat([feat_data, e4_timestamp(
-                                    pd.read_csv(os.path.join(dirpath, d,
-                                    feat_file), names=[sensors[feature]],
-                                    index_col=False))])
-                    print(' : '.join(['E4 ', ' '.join([sensors[feature],
-                          'data, adding']),  feat_file, str(feat_data.shape)]))
-    save_df(feat_data, sensors[feature], 'E4')
+                    feat_data.add_file(os.path.join(d, feat_file), e4_1c_data,
+                                       sensors[feature])
+    return(feat_data.save())
+
+def e4_acc_data(csv_file):
+    """
+    Function to collect E4 accelerometry data and return dataframe with Linux
+    time-series index column and x, y, z value columns
+
+    Parameters
+    ----------
+    csv_file : string
+        path to an E4 ACC.csv file
+
+    Returns
+    -------
+    new_df : pandas dataframe
+        dataframe with Linux time-series index column and accelerometer value
+        columns
+    """
+    # convert from 1/64g to g
+    return(e4_timestamp(pd.read_csv(csv_file, names=axes, index_col=False)) /
+           64)
+
+def e4_1c_data(csv_file, label):
+    """
+    Function to collect single-column E4 data and return dataframe with Linux
+    time-series index column and feature value column
+
+    Parameters
+    ----------
+    csv_file : string
+        path to an E4 csv file (e.g. BVP.csv, EDA.csv, HR.csv, TEMP.csv)
+
+    label : string
+        the name to give the feature column
+
+    Returns
+    -------
+    new_df : pandas dataframe
+        dataframe with Linux time-series index column and feature value
+        column
+    """
+    return(e4_timestamp(pd.read_csv(csv_file, names=[label], index_col=False)))
 
 """
 ----------------
@@ -350,7 +469,8 @@ Fitbit Blaze
 GENEActiv Original
 ------------------
 """
-def geneactiv_acc(dirpath):
+def geneactiv_acc(dirpath, on_disk=False, processes=None,
+                  incremental=False, source='csv', calibrate=None):
     """
     Function to take all GENEActiv accelerometry data from a directory and
     format those data with Linux time-series index column and x, y, z value
@@ -361,6 +481,28 @@ def geneactiv_acc(dirpath):
     dirpath : string
         path to E4 outputs
 
+    on_disk : boolean
+        append each file's data to the organized csv as it is parsed instead
+        of combining all files in memory (default=False)
+
+    processes : int or None
+        number of worker processes to parse files with; files are parsed one
+        at a time in this process if None or 1 (default=None)
+
+    incremental : boolean
+        only parse files that are new or changed since the last run and merge
+        their rows into the existing organized data (default=False)
+
+    source : string
+        'csv' to ingest GENEAread csv exports or 'bin' to ingest raw .bin
+        files; only files of that type are read, so a recording with both is
+        never ingested twice (default='csv')
+
+    calibrate : boolean or None
+        with source='bin', autocalibrate each file against local gravity
+        (default=None, i.e. all but *_Recalibrate.bin files already
+        calibrated by GGIR; see geneactiv_bin_acc_data())
+
     Returns
     -------
     acc_data : pandas dataframe
@@ -372,41 +514,54 @@ def geneactiv_acc(dirpath):
         comma-separated-values file with Linux time-series index column and x,
         y, z accelerometer value columns
     """
-    acc_data_black = pd.DataFrame()
-    acc_data_pink = pd.DataFrame()
-    for acc in os.listdir(dirpath):
-        if ("Jon" in acc or "black" in acc) and acc.endswith("csv"):
-            if acc_data_black.empty:
-                with open(os.path.join(dirpath, acc), 'r') as acc_f:
-                    acc_data_black = geneactiv_acc_data(acc_f)
-            else:
-                with open(os.path.join(dirpath, acc), 'r') as acc_f:
-                    acc_data_black = pd.concat([acc_data_black,
-                                     geneactiv_acc_data(acc_f)])
-            print(' : '.join(['Black GENEActiv accelorometer data, adding',
-                  acc, str(acc_data_black.shape)]))
-        elif (("Curt" in acc or "Arno" in acc or "pink" in acc) and acc.endswith("csv")):
-            if acc_data_pink.empty:
-                with open(os.path.join(dirpath, acc), 'r') as acc_f:
-                    acc_data_pink = geneactiv_acc_data(acc_f)
-            else:
-                with open(os.path.join(dirpath, acc), 'r') as acc_f:
-                    acc_data_pink = pd.concat([acc_data_pink,
-                                     geneactiv_acc_data(acc_f)])
-            print(' : '.join(['Pink GENEActiv accelorometer data, adding',
-                  acc, str(acc_data_pink.shape)]))
-    save_df(acc_data_black, 'accelerometer', 'GENEActiv_black')
-    save_df(acc_data_pink, 'accelerometer', 'GENEActiv_pink')
-
-def geneactiv_acc_data(open_csv):
+    acc_data_black = Accumulator('accelerometer', 'GENEActiv_black', on_disk,
+                     processes, incremental)
+    acc_data_pink = Accumulator('accelerometer', 'GENEActiv_pink', on_disk,
+                    processes, incremental)
+    parse = geneactiv_source(source, geneactiv_acc_data,
+            geneactiv_bin_acc_data)
+    args = [calibrate] if source == 'bin' else []
+    for acc in sorted(os.listdir(dirpath)):
+        if ("Jon" in acc or "black" in acc) and acc.endswith(source):
+            acc_data_black.add_file(os.path.join(dirpath, acc), parse,
+                                    acc_data_black.chunk_rows, *args)
+        elif (("Curt" in acc or "Arno" in acc or "pink" in acc) and
+              acc.endswith(source)):
+            acc_data_pink.add_file(os.path.join(dirpath, acc), parse,
+                                   acc_data_pink.chunk_rows, *args)
+    return(acc_data_black.save(), acc_data_pink.save())
+
+def geneactiv_acc_data(open_csv, chunk_rows=None):
     """
     Function to collect GENEActiv data and return dataframe with Linux time-
     series index column and x, y, z value columns
 
+    Parameters
+    ----------
+    open_csv : open csv file or string
+        an open GENEActiv csv file or the path to one
+
+    chunk_rows : int or None
+        if given, stream the file and yield dataframes of at most this many
+        rows instead of returning one dataframe (default=None)
+
+    Returns
+    -------
+    new_df : pandas dataframe or generator of pandas dataframes
+        dataframe with Linux time-series index column and accelerometer value
+        columns
+    """
+    return(organize_chunks(drop_non_csv_chunks(open_csv, 100, False,
+           chunk_rows), geneactiv_acc_chunk, chunk_rows))
+
+def geneactiv_acc_chunk(df):
+    """
+    Function to organize one chunk of a GENEActiv csv file
+
     Parameters
     ----------
     df : pandas dataframe
-        dataframe for which to organize data
+        typed chunk from drop_non_csv_chunks()
 
     Returns
     -------
@@ -414,17 +569,14 @@ def geneactiv_acc_data(open_csv):
         dataframe with Linux time-series index column and accelerometer value
         columns
     """
-    df = drop_non_csv(open_csv, 100)
-    df[0] = df[0].map(datetimeint)
-    new_df = pd.DataFrame()
-    new_df[['Timestamp', 'x', 'y', 'z']] = df[[0,1,2,3]]
-    new_df.set_index('Timestamp', inplace=True)
+    new_df = df[[1, 2, 3]].astype(np.float64)
+    new_df.columns = axes
+    new_df.index = pd.Index(datetimearray(df[0]), name='Timestamp')
     # convert from 1/8g to g
-    for axis in axes:
-        new_df[axis] = new_df[axis].map(lambda x: float(x)/4)
-    return(new_df)
+    return(new_df / 4)
 
-def geneactiv_1c(dirpath, feature):
+def geneactiv_1c(dirpath, feature, on_disk=False, processes=None,
+                 incremental=False, source='csv'):
     """
     Function to take all GENEActiv accelerometry data from a directory and
     format those data with Linux time-series index column and feature value
@@ -438,6 +590,22 @@ def geneactiv_1c(dirpath, feature):
     feature : string
         the column name in the source file for the feature we want to look at
 
+    on_disk : boolean
+        append each file's data to the organized csv as it is parsed instead
+        of combining all files in memory (default=False)
+
+    processes : int or None
+        number of worker processes to parse files with; files are parsed one
+        at a time in this process if None or 1 (default=None)
+
+    incremental : boolean
+        only parse files that are new or changed since the last run and merge
+        their rows into the existing organized data (default=False)
+
+    source : string
+        'csv' to ingest GENEAread csv exports or 'bin' to ingest raw .bin
+        files (default='csv')
+
     Returns
     -------
     acc_data : pandas dataframe
@@ -450,46 +618,70 @@ def geneactiv_1c(dirpath, feature):
         feature value columns
     """
     sensor = {4:'light', 6:'temperature'}
-    feat_data_black = pd.DataFrame()
-    feat_data_pink = pd.DataFrame()
-    for feat_file in os.listdir(dirpath):
-        if ("Jon" in feat_file or "black" in feat_file) and feat_file.endswith("csv"):
-            if feat_data_black.empty:
-                with open(os.path.join(dirpath, feat_file), 'r') as fd_f:
-                    feat_data_black = geneactiv_1c_data(fd_f, feature, sensor[
-                                      feature])
-            else:
-                with open(os.path.join(dirpath, feat_file), 'r') as fd_f:
-                    feat_data_black = pd.concat([feat_data_black,
-                                     geneactiv_1c_data(fd_f, feature, sensor[
-                                                       feature])])
-            print(' : '.join(['Black GENEActiv ', ' '.join([sensor[feature],
-                  'data, adding']), feat_file, str(feat_data_black.shape)]))
+    feat_data_black = Accumulator(sensor[feature], 'GENEActiv_black', on_disk,
+                      processes, incremental)
+    feat_data_pink = Accumulator(sensor[feature], 'GENEActiv_pink', on_disk,
+                     processes, incremental)
+    parse = geneactiv_source(source, geneactiv_1c_data, geneactiv_bin_1c_data)
+    for feat_file in sorted(os.listdir(dirpath)):
+        if ("Jon" in feat_file or "black" in feat_file) and feat_file.endswith(
+           source):
+            feat_data_black.add_file(os.path.join(dirpath, feat_file), parse,
+                                     feature, sensor[feature],
+                                     feat_data_black.chunk_rows)
         elif (("Curt" in feat_file or "Arno" in feat_file or "pink" in feat_file) and
-              feat_file.endswith("csv")):
-            if feat_data_pink.empty:
-                with open(os.path.join(dirpath, feat_file), 'r') as fd_f:
-                    feat_data_pink = geneactiv_1c_data(fd_f, feature, sensor[
-                                     feature])
-            else:
-                with open(os.path.join(dirpath, feat_file), 'r') as fd_f:
-                    feat_data_pink = pd.concat([feat_data_pink,
-                                     geneactiv_1c_data(fd_f, feature, sensor[
-                                                       feature])])
-            print(' : '.join(['Pink GENEActiv,', ' '.join([sensor[feature],
-                  'data, adding']), feat_file, str(feat_data_pink.shape)]))
-    save_df(feat_data_black, sensor[feature], 'GENEActiv_black')
-    save_df(feat_data_pink, sensor[feature], 'GENEActiv_pink')
+              feat_file.endswith(source)):
+            feat_data_pink.add_file(os.path.join(dirpath, feat_file), parse,
+                                    feature, sensor[feature],
+                                    feat_data_pink.chunk_rows)
+    return(feat_data_black.save(), feat_data_pink.save())
 
-def geneactiv_1c_data(open_csv, feature, label):
+def geneactiv_1c_data(open_csv, feature, label, chunk_rows=None):
     """
     Function to collect GENEActiv data and return dataframe with Linux time-
     series index column and feature value columns
 
+    Parameters
+    ----------
+    open_csv : open csv file or string
+        an open GENEActiv csv file or the path to one
+
+    feature : int
+        the column number in the source file for the feature we want to look
+        at
+
+    label : string
+        the name to give the feature column
+
+    chunk_rows : int or None
+        if given, stream the file and yield dataframes of at most this many
+        rows instead of returning one dataframe (default=None)
+
+    Returns
+    -------
+    new_df : pandas dataframe or generator of pandas dataframes
+        dataframe with Linux time-series index column and feature value
+        column
+    """
+    return(organize_chunks(drop_non_csv_chunks(open_csv, 100, False,
+           chunk_rows), lambda df: geneactiv_1c_chunk(df, feature, label),
+           chunk_rows))
+
+def geneactiv_1c_chunk(df, feature, label):
+    """
+    Function to organize one chunk of a GENEActiv csv file
+
     Parameters
     ----------
     df : pandas dataframe
-        dataframe for which to organize data
+        typed chunk from drop_non_csv_chunks()
+
+    feature : int
+        the column number in the source file for the feature we want to look
+        at
+
+    label : string
+        the name to give the feature column
 
     Returns
     -------
@@ -497,19 +689,133 @@ def geneactiv_1c_data(open_csv, feature, label):
         dataframe with Linux time-series index column and feature value
         column
     """
-    df = drop_non_csv(open_csv, 100)
-    df[0] = df[0].map(datetimeint)
-    new_df = pd.DataFrame()
-    new_df[['Timestamp', label]] = df[[0,feature]]
-    new_df.set_index('Timestamp', inplace=True)
+    new_df = df[[feature]].copy()
+    new_df.columns = [label]
+    new_df.index = pd.Index(datetimearray(df[0]), name='Timestamp')
     return(new_df)
 
+def geneactiv_bin_acc_data(bin_file, chunk_rows=None, calibrate=None,
+                           cache_dir=None):
+    """
+    Function to collect GENEActiv data directly from a raw .bin file and
+    return dataframe with Linux time-series index column and x, y, z value
+    columns
+
+    Parameters
+    ----------
+    bin_file : string
+        path to a GENEActiv .bin file
+
+    chunk_rows : int or None
+        if given, stream the file and yield dataframes of about this many rows
+        instead of returning one dataframe (default=None)
+
+    calibrate : boolean or None
+        autocalibrate against local gravity with calibrated_bin(), replacing
+        JonClucasCalibrationScript.R (default=None, i.e. unless the file is
+        GGIR output already recalibrated by that script, *_Recalibrate.bin)
+
+    cache_dir : string or None
+        directory to cache calibration coefficients in (default=None, i.e.
+        `organized_dir`/calibration)
+
+    Returns
+    -------
+    new_df : pandas dataframe or generator of pandas dataframes
+        dataframe with Linux time-series index column and accelerometer value
+        columns in g
+    """
+    if calibrate is None:
+        calibrate = 'Recalibrate' not in os.path.basename(bin_file)
+    if calibrate:
+        chunks = calibrated_bin(bin_file, bin_pages(chunk_rows), cache_dir=
+                 cache_dir if cache_dir else os.path.dirname(organized_path(
+                 'calibration', 'GENEActiv')))
+    else:
+        chunks = read_bin(bin_file, bin_pages(chunk_rows))
+    return(organize_chunks(chunks, lambda df: df[axes], chunk_rows))
+
+def geneactiv_bin_1c_data(bin_file, feature, label, chunk_rows=None):
+    """
+    Function to collect GENEActiv data directly from a raw .bin file and
+    return dataframe with Linux time-series index column and feature value
+    column
+
+    Parameters
+    ----------
+    bin_file : string
+        path to a GENEActiv .bin file
+
+    feature : int
+        the column number the feature would have in a GENEAread csv export
+        (4: light, 6: temperature)
+
+    label : string
+        the name to give the feature column
+
+    chunk_rows : int or None
+        if given, stream the file and yield dataframes of about this many rows
+        instead of returning one dataframe (default=None)
+
+    Returns
+    -------
+    new_df : pandas dataframe or generator of pandas dataframes
+        dataframe with Linux time-series index column and feature value
+        column
+    """
+    column = {4:'light', 6:'temperature'}[feature]
+    return(organize_chunks(read_bin(bin_file, bin_pages(chunk_rows)), lambda
+           df: df[[column]].rename(columns={column: label}), chunk_rows))
+
+def geneactiv_source(source, csv_parse, bin_parse):
+    """
+    Function to choose the parser for one type of GENEActiv source file.
+
+    Parameters
+    ----------
+    source : string
+        'csv' or 'bin'
+
+    csv_parse : function
+        parser for GENEAread csv exports
+
+    bin_parse : function
+        parser for raw .bin files
+
+    Returns
+    -------
+    parse : function
+        `csv_parse` or `bin_parse`
+    """
+    if source not in ['csv', 'bin']:
+        raise ValueError("GENEActiv source must be 'csv' or 'bin', not "
+                         "{0}".format(source))
+    return(csv_parse if source == 'csv' else bin_parse)
+
+def bin_pages(chunk_rows):
+    """
+    Function to convert a row count to a whole number of GENEActiv .bin pages.
+
+    Parameters
+    ----------
+    chunk_rows : int or None
+        rows per chunk (None for `csv_chunk_rows`)
+
+    Returns
+    -------
+    pages : int
+        whole pages per chunk, at least 1
+    """
+    return(max(1, (chunk_rows if chunk_rows else csv_chunk_rows) //
+           page_samples))
+
 """
 ----------------
 Wavelet Biostrap
 ----------------
 """
-def wavelet_acc(dirpath):
+def wavelet_acc(dirpath, on_disk=False, processes=None,
+                incremental=False):
     """
     Function to take all Wavelet accelerometry data from a directory and format
     those data with Linux time-series index columns and x, y, z value columns
@@ -519,6 +825,18 @@ def wavelet_acc(dirpath):
     dirpath : string
         path to Wavelet outputs
 
+    on_disk : boolean
+        append each file's data to the organized csv as it is parsed instead
+        of combining all files in memory (default=False)
+
+    processes : int or None
+        number of worker processes to parse files with; files are parsed one
+        at a time in this process if None or 1 (default=None)
+
+    incremental : boolean
+        only parse files that are new or changed since the last run and merge
+        their rows into the existing organized data (default=False)
+
     Returns
     -------
     acc_data_returns : pandas dataframe
@@ -531,33 +849,15 @@ def wavelet_acc(dirpath):
         y, z accelerometer value columns
     """
     csv_path = os.path.join(os.path.dirname(dirpath), 'accel')
-    acc_data = pd.DataFrame()
-    for acc in os.listdir(csv_path):
+    acc_data = Accumulator('accelerometer', 'Wavelet', on_disk, processes,
+               incremental)
+    for acc in sorted(os.listdir(csv_path)):
         if acc.endswith("csv"):
-            if acc_data.empty:
-                acc_data = pd.read_csv(os.path.join(csv_path, acc),
-                           header=0, skip_blank_lines=True, comment="C",
-                           parse_dates=['timestamp'], infer_datetime_format=
-                           True)
-                print(' : '.join([acc, str(acc_data.shape)]))
-            else:
-                acc_data = pd.concat([acc_data, pd.read_csv(os.path.join(
-                           csv_path, acc), header=0, skip_blank_lines=True,
-                           comment="C", parse_dates=['timestamp'],
-                           infer_datetime_format=True)])
-            print(' : '.join(['Wavelet accelorometer data, adding',  acc, str(
-                      acc_data.shape)]))
-    acc_data_returns = pd.DataFrame()
-    acc_data_returns[['Timestamp', 'x', 'y', 'z']] = acc_data[['timestamp',
-                                                     'x', 'y', 'z']]
-    acc_data_returns.set_index('Timestamp', inplace=True)
-    # convert from 1/64g to g
-    for axis in axes:
-        acc_data_returns[axis] = acc_data_returns[axis].map(lambda x: float(x)/
-                                 64)
-    save_df(acc_data_returns, 'accelerometer', 'Wavelet')
+            acc_data.add_file(os.path.join(csv_path, acc), wavelet_acc_data)
+    return(acc_data.save())
 
-def wavelet_ppg(dirpath):
+def wavelet_ppg(dirpath, on_disk=False, processes=None,
+                incremental=False):
     """
     Function to take all Wavelet photoplethysmograph data from a directory and
     format those data with Linux time-series index columns and nanowatt value
@@ -568,6 +868,18 @@ def wavelet_ppg(dirpath):
     dirpath : string
         path to Wavelet outputs
 
+    on_disk : boolean
+        append each file's data to the organized csv as it is parsed instead
+        of combining all files in memory (default=False)
+
+    processes : int or None
+        number of worker processes to parse files with; files are parsed one
+        at a time in this process if None or 1 (default=None)
+
+    incremental : boolean
+        only parse files that are new or changed since the last run and merge
+        their rows into the existing organized data (default=False)
+
     Returns
     -------
     acc_data_returns : pandas dataframe
@@ -581,34 +893,570 @@ def wavelet_ppg(dirpath):
         nanowatt PPG value columns
     """
     csv_path = os.path.join(dirpath, 'CSV')
-    ppg_data = pd.DataFrame()
-    for ppg in os.listdir(csv_path):
+    ppg_data = Accumulator('photoplethysmograph', 'Wavelet', on_disk,
+               processes, incremental)
+    for ppg in sorted(os.listdir(csv_path)):
         if ppg.endswith("csv"):
-            if ppg_data.empty:
-                ppg_data = pd.read_csv(os.path.join(csv_path, ppg),
-                           header=0, skip_blank_lines=True, comment="C")
-                print(' : '.join([ppg, str(ppg_data.shape)]))
-            else:
-                ppg_data = pd.concat([ppg_data, pd.read_csv(os.path.join(
-                           csv_path, ppg), header=0, skip_blank_lines=True,
-                           comment="C")])
-            print(' : '.join(['Wavelet photoplethysmograph data, adding',  ppg,
-                  str(ppg_data.shape)]))
-    ppg_data['timestamp'] = ppg_data['timestamp'].map(lambda x:
-                            datetime.fromtimestamp(int(x)/1000).strftime(
-                            "%Y-%m-%d %H:%M:%S.%f"), na_action='ignore')
-    ppg_data_returns = pd.DataFrame()
-    ppg_data_returns[['Timestamp', 'infrared', 'red', 'infrared_filtered',
-                      'red_filtered']] = ppg_data[['timestamp', ' ir', ' red',
-                                         ' ir_filt', ' red_filt']]
-    ppg_data_returns.set_index('Timestamp', inplace=True)
-    save_df(ppg_data_returns, 'photoplethysmograph', 'Wavelet')
+            ppg_data.add_file(os.path.join(csv_path, ppg), wavelet_ppg_data)
+    return(ppg_data.save())
+
+def wavelet_acc_data(csv_file):
+    """
+    Function to collect Wavelet accelerometry data and return dataframe with
+    Linux time-series index column and x, y, z value columns
+
+    Parameters
+    ----------
+    csv_file : string
+        path to a Wavelet accelerometer csv file
+
+    Returns
+    -------
+    new_df : pandas dataframe
+        dataframe with Linux time-series index column and accelerometer value
+        columns
+    """
+    df = pd.read_csv(csv_file, header=0, skip_blank_lines=True, comment="C",
+         parse_dates=['timestamp'])
+    new_df = df[axes].astype(np.float64)
+    new_df.index = pd.Index(df['timestamp'].values, name='Timestamp')
+    # convert from 1/64g to g
+    return(new_df / 64)
+
+def wavelet_ppg_data(csv_file):
+    """
+    Function to collect Wavelet photoplethysmograph data and return dataframe
+    with Linux time-series index column and nanowatt value columns
+
+    Parameters
+    ----------
+    csv_file : string
+        path to a Wavelet photoplethysmograph csv file
+
+    Returns
+    -------
+    new_df : pandas dataframe
+        dataframe with Linux time-series index column and nanowatt value
+        columns
+    """
+    df = pd.read_csv(csv_file, header=0, skip_blank_lines=True, comment="C")
+    new_df = df[[' ir', ' red', ' ir_filt', ' red_filt']].copy()
+    new_df.columns = ['infrared', 'red', 'infrared_filtered', 'red_filtered']
+    new_df.index = pd.Index(fromtimestamp_array(df['timestamp'].values.astype(
+                   np.float64) / 1000), name='Timestamp')
+    return(new_df)
 
 """
 -----------------
 general functions
 -----------------
 """
+class Accumulator(object):
+    """
+    Class to collect organized dataframes from many source files and combine
+    them once, so ingest cost stays linear in the number of files. With
+    `on_disk`, each part is appended straight to the organized csv instead;
+    parts that arrive out of time order (or new rows for existing organized
+    data) start a sorted run file of their own, and save() merges the runs.
+
+    Parameters
+    ----------
+    sensor : string
+        sensor for which the dataframes hold data
+
+    device : string
+        device the data are from
+
+    on_disk : boolean
+        append parts to `organized_dir`/`sensor`/`device`.csv as they arrive
+        rather than holding them in memory; always writes csv regardless of
+        `organized_format` (default=False)
+
+    processes : int or None
+        size of the process pool that files queued with add_file() are parsed
+        in; files are parsed immediately in this process if None or 1
+        (default=None)
+
+    incremental : boolean
+        only parse source files that are new or changed since the last run,
+        according to the manifest stored next to the organized output, and
+        merge their rows into the existing organized data (default=False)
+
+    Attributes
+    ----------
+    chunk_rows : int or None
+        rows per chunk that `*_data` functions should stream when feeding this
+        accumulator (`csv_chunk_rows` if `on_disk` and not parsing in a
+        process pool, otherwise None)
+
+    rows : int
+        number of rows added so far
+
+    manifest : dictionary
+        source file paths and their size, mtime, md5 hash and first and last
+        timestamps
+    """
+    def __init__(self, sensor, device, on_disk=False, processes=None,
+                 incremental=False):
+        self.sensor = sensor
+        self.device = device
+        self.on_disk = on_disk
+        self.processes = processes if processes and processes > 1 else None
+        self.chunk_rows = csv_chunk_rows if on_disk and not self.processes \
+                          else None
+        self.incremental = incremental
+        self.parts = []
+        self.jobs = []
+        self.replaced = []
+        self.rows = 0
+        self.runs = []
+        self.last = None
+        self.manifest = load_manifest(self.manifest_path()) if incremental \
+                        and os.path.exists(self.output_path()) else {}
+        # existing organized data to merge into
+        self.merge = bool(self.manifest)
+        if self.merge and on_disk:
+            # new rows always go to a run of their own, merged in by save()
+            self.runs = [self.output_path()]
+            self.last = pd.Timestamp.max
+
+    def output_path(self):
+        """
+        Method to get the path of the organized output file.
+
+        Returns
+        -------
+        path : string
+            `organized_dir`/`sensor`/`device`.(csv or `organized_format`)
+        """
+        return(organized_path(self.sensor, self.device, 'csv' if self.on_disk
+               else organized_format))
+
+    def manifest_path(self):
+        """
+        Method to get the path of the manifest of processed source files.
+
+        Returns
+        -------
+        path : string
+            `organized_dir`/`sensor`/`device`.manifest.json
+        """
+        return(organized_path(self.sensor, self.device, 'manifest.json'))
+
+    def add(self, part, source=''):
+        """
+        Method to add an organized dataframe, or a generator of organized
+        chunks, from one source file.
+
+        Parameters
+        ----------
+        part : pandas dataframe or iterable of pandas dataframes
+            organized data
+
+        source : string
+            name of the source file, for progress output
+
+        Returns
+        -------
+        span : list of strings
+            first and last timestamps added (empty if no rows were added)
+        """
+        firsts = []
+        lasts = []
+        for chunk in ([part] if isinstance(part, pd.DataFrame) else part):
+            if self.on_disk:
+                self.write_run(chunk)
+            else:
+                self.parts.append(chunk)
+            if len(chunk):
+                firsts.append(chunk.index.min())
+                lasts.append(chunk.index.max())
+            self.rows += len(chunk)
+        print(' : '.join([' '.join([self.device, self.sensor,
+              'data, adding']), source, ' '.join([str(self.rows), 'rows'])]))
+        return([str(min(firsts)), str(max(lasts))] if firsts else [])
+
+    def write_run(self, chunk):
+        """
+        Method to append an organized chunk to the current run file, starting
+        a new run file if the chunk begins before the last timestamp written,
+        so that every run stays sorted by timestamp.
+
+        Parameters
+        ----------
+        chunk : pandas dataframe
+            organized data
+        """
+        if not chunk.index.is_monotonic_increasing:
+            chunk = chunk.sort_index(kind='mergesort')
+        if not self.runs or (len(chunk) and self.last is not None and
+           chunk.index[0] < self.last):
+            self.runs.append(self.output_path() if not self.runs else
+                             '.'.join([self.output_path(), 'run{0}'.format(
+                             len(self.runs))]))
+            self.last = None
+            header = True
+        else:
+            header = False
+        chunk.to_csv(self.runs[-1], mode='w' if header else 'a', header=
+                     header)
+        if len(chunk):
+            self.last = chunk.index[-1]
+
+    def add_file(self, path, parse, *args, ignore_errors=False):
+        """
+        Method to parse one source file with `parse(path, *args)` and add the
+        result. With `processes`, the file is queued and parsed in the
+        process pool when the accumulator is saved. With `incremental`,
+        files unchanged since the last run are skipped.
+
+        Parameters
+        ----------
+        path : string
+            path to the source file
+
+        parse : function
+            module-level function returning organized data for one file
+
+        *args : various types
+            additional arguments for `parse`
+
+        ignore_errors : boolean
+            skip files that `parse` raises an exception for (default=False)
+        """
+        source = os.path.basename(path)
+        if self.incremental:
+            entry = self.changed(path)
+            if entry is None:
+                return
+        else:
+            entry = {}
+        if self.processes:
+            self.jobs.append((path, parse, args, ignore_errors, entry))
+            return
+        try:
+            self.record(path, entry, self.add(parse(path, *args), source))
+        except:
+            if not ignore_errors:
+                raise
+
+    def changed(self, path):
+        """
+        Method to compare a source file against the manifest. A file whose
+        size and mtime match is unchanged; otherwise its md5 hash decides. If
+        a previously processed file changed, its old rows are dropped from
+        the organized data.
+
+        Parameters
+        ----------
+        path : string
+            path to the source file
+
+        Returns
+        -------
+        entry : dictionary or None
+            new manifest entry (without timestamps) if the file is new or
+            changed, None if it is unchanged
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        old = self.manifest.get(path, {})
+        entry = {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+        if old and old['size'] == entry['size'] and old['mtime'] == entry[
+           'mtime']:
+            return(None)
+        entry['md5'] = file_md5(path)
+        if old and old['md5'] == entry['md5']:
+            old['mtime'] = entry['mtime']
+            return(None)
+        if old and old.get('first'):
+            self.replaced.append((old['first'], old['last']))
+            if self.on_disk:
+                drop_time_ranges_csv(self.output_path(), self.replaced[-1:])
+        return(entry)
+
+    def record(self, path, entry, span):
+        """
+        Method to store a parsed source file's manifest entry.
+
+        Parameters
+        ----------
+        path : string
+            path to the source file
+
+        entry : dictionary
+            manifest entry from changed()
+
+        span : list of strings
+            first and last timestamps parsed from the file
+        """
+        if self.incremental:
+            entry['first'], entry['last'] = span if span else [None, None]
+            self.manifest[os.path.abspath(path)] = entry
+
+    def parse_queued(self):
+        """
+        Method to parse all queued files across the process pool and add each
+        result as soon as it and every file queued before it are parsed, so
+        at most a window of twice the pool size of parsed files is held in
+        memory. Results are added in queue order, not timestamp order: parts
+        that overlap or arrive out of order are sorted by combine() in memory
+        and by merging run files in save() on disk.
+        """
+        if not self.jobs:
+            return
+        from collections import deque
+        from concurrent.futures import ProcessPoolExecutor
+        window = deque()
+        with ProcessPoolExecutor(max_workers=self.processes) as pool:
+            for n, (path, parse, args, ignore_errors, entry) in enumerate(
+                self.jobs):
+                window.append((path, pool.submit(parse, path, *args),
+                              ignore_errors, entry))
+                while window and (len(window) >= 2 * self.processes or n ==
+                      len(self.jobs) - 1):
+                    self.add_queued(*window.popleft())
+        self.jobs = []
+
+    def add_queued(self, path, future, ignore_errors, entry):
+        """
+        Method to add the result of one file parsed in the process pool.
+
+        Parameters
+        ----------
+        path : string
+            path to the source file
+
+        future : concurrent.futures.Future
+            pending result of parsing the file
+
+        ignore_errors : boolean
+            skip the file if parsing it raised an exception
+
+        entry : dictionary
+            manifest entry from changed()
+        """
+        try:
+            part = future.result()
+        except:
+            if not ignore_errors:
+                raise
+            return
+        self.record(path, entry, self.add(part, os.path.basename(path)))
+
+    def combine(self):
+        """
+        Method to combine all in-memory parts with a single concatenation,
+        sorted by timestamp if the parts overlap. With `incremental`, the
+        existing organized data (less any rows from changed source files)
+        are included.
+
+        Returns
+        -------
+        df : pandas dataframe
+            combined dataframe (empty if nothing was added)
+        """
+        self.parse_queued()
+        parts = self.parts
+        if self.merge:
+            previous = load_df(self.output_path()).set_index('Timestamp')
+            parts = [drop_time_ranges(previous, self.replaced)] + parts
+        if not parts:
+            return(pd.DataFrame())
+        df = pd.concat(parts)
+        if not df.index.is_monotonic_increasing:
+            df.sort_index(kind='mergesort', inplace=True)
+        return(df)
+
+    def save(self):
+        """
+        Method to save the accumulated data via save_df().
+
+        Returns
+        -------
+        df : pandas dataframe or string
+            the combined dataframe, or the path to the organized csv if
+            `on_disk`
+        """
+        if self.on_disk:
+            self.parse_queued()
+            if not self.runs:
+                save_df(pd.DataFrame(), self.sensor, self.device, 'csv')
+            elif len(self.runs) > 1:
+                merge_csv_runs(self.runs, self.output_path())
+                self.runs = [self.output_path()]
+            print("Saved.")
+            df = self.output_path()
+        elif self.merge and not (self.parts or self.jobs or self.replaced):
+            print(' '.join([self.device, self.sensor, 'data up to date.']))
+            df = load_df(self.output_path()).set_index('Timestamp')
+        else:
+            df = save_df(self.combine(), self.sensor, self.device)
+        if self.incremental:
+            save_manifest(self.manifest_path(), self.manifest)
+        return(df)
+
+def drop_time_ranges(df, ranges):
+    """
+    Function to drop rows whose time-series index falls in any of the given
+    inclusive time ranges.
+
+    Parameters
+    ----------
+    df : pandas dataframe
+        dataframe with Linux time-series index
+
+    ranges : list of (string, string) tuples
+        first and last timestamps of each range to drop
+
+    Returns
+    -------
+    df : pandas dataframe
+        dataframe without the dropped rows
+    """
+    if not ranges or df.empty:
+        return(df)
+    index = pd.DatetimeIndex(df.index)
+    drop = np.zeros(len(df), dtype=bool)
+    for first, last in ranges:
+        drop |= (index >= pd.Timestamp(first)) & (index <= pd.Timestamp(last))
+    return(df[~drop])
+
+def drop_time_ranges_csv(csv_file, ranges):
+    """
+    Function to drop rows in the given time ranges from an organized csv file,
+    streaming it in chunks and replacing it in place.
+
+    Parameters
+    ----------
+    csv_file : string
+        path to organized csv file
+
+    ranges : list of (string, string) tuples
+        first and last timestamps of each range to drop
+    """
+    temp_file = '.'.join([csv_file, 'tmp'])
+    header = True
+    for chunk in pd.read_csv(csv_file, index_col='Timestamp', parse_dates=[
+                 'Timestamp'], chunksize=csv_chunk_rows):
+        drop_time_ranges(chunk, ranges).to_csv(temp_file, mode='w' if header
+                                               else 'a', header=header)
+        header = False
+    os.replace(temp_file, csv_file)
+
+def merge_csv_runs(run_files, csv_file, chunk_rows=None):
+    """
+    Function to merge organized csv files that are each sorted by timestamp
+    into one sorted organized csv file, streaming them in chunks so at most
+    one chunk per run is in memory. Run files other than `csv_file` are
+    removed.
+
+    Parameters
+    ----------
+    run_files : list of strings
+        paths to sorted organized csv files
+
+    csv_file : string
+        path to merged organized csv file (may be one of `run_files`)
+
+    chunk_rows : int or None
+        rows to read from each run at a time (default=None, i.e.
+        `csv_chunk_rows`)
+    """
+    temp_file = '.'.join([csv_file, 'tmp'])
+    readers = [pd.read_csv(run_file, index_col='Timestamp', parse_dates=[
+               'Timestamp'], chunksize=chunk_rows if chunk_rows else
+               csv_chunk_rows) for run_file in run_files]
+    buffers = [next(reader, None) for reader in readers]
+    columns = next((b.columns for b in buffers if b is not None), None)
+    header = True
+    while any(b is not None and len(b) for b in buffers):
+        # every run's rows up to the smallest last buffered timestamp are in
+        # memory, so they can be written in order
+        bound = min(b.index[-1] for b in buffers if b is not None and len(b))
+        parts = []
+        for i, b in enumerate(buffers):
+            if b is None:
+                continue
+            cut = b.index.searchsorted(bound, side='right')
+            parts.append(b.iloc[:cut])
+            buffers[i] = b.iloc[cut:] if cut < len(b) else next(readers[i],
+                         None)
+        pd.concat(parts).sort_index(kind='mergesort').to_csv(temp_file, mode=
+                                    'w' if header else 'a', header=header)
+        header = False
+    for reader in readers:
+        reader.close()
+    if header:
+        pd.DataFrame(columns=columns).rename_axis('Timestamp').to_csv(
+                     temp_file)
+    os.replace(temp_file, csv_file)
+    for run_file in run_files:
+        if run_file != csv_file and os.path.exists(run_file):
+            os.remove(run_file)
+
+def file_md5(data_file, block_size=1048576):
+    """
+    Function to compute the md5 hash of a file, reading it in blocks.
+
+    Parameters
+    ----------
+    data_file : string
+        path to file
+
+    block_size : int
+        bytes to read at a time (default=1048576)
+
+    Returns
+    -------
+    hash : string
+        hexadecimal md5 digest
+    """
+    import hashlib
+    md5 = hashlib.md5()
+    with open(data_file, 'rb') as fp:
+        for block in iter(lambda: fp.read(block_size), b''):
+            md5.update(block)
+    return(md5.hexdigest())
+
+def load_manifest(manifest_file):
+    """
+    Function to load a manifest of processed source files.
+
+    Parameters
+    ----------
+    manifest_file : string
+        path to manifest json file
+
+    Returns
+    -------
+    manifest : dictionary
+        source file paths and their size, mtime, md5 hash and first and last
+        timestamps (empty if there is no manifest yet)
+    """
+    if not os.path.exists(manifest_file):
+        return({})
+    with open(manifest_file) as fp:
+        return(json.load(fp))
+
+def save_manifest(manifest_file, manifest):
+    """
+    Function to save a manifest of processed source files.
+
+    Parameters
+    ----------
+    manifest_file : string
+        path to manifest json file
+
+    manifest : dictionary
+        source file paths and their size, mtime, md5 hash and first and last
+        timestamps
+    """
+    temp_file = '.'.join([manifest_file, 'tmp'])
+    with open(temp_file, 'w') as fp:
+        json.dump(manifest, fp, indent=2, sort_keys=True)
+    os.replace(temp_file, manifest_file)
+
 def datetimedt(x):
     """
     Function to turn a datetime string in format "%Y-%m-%d %H:%M:%S.%f"
@@ -626,6 +1474,38 @@ def datetimedt(x):
     """
     return(datetime.strptime(x, "%Y-%m-%d %H:%M:%S.%f"))
 
+def fromtimestamp_array(seconds):
+    """
+    Function to turn an array of Linux timestamps into local-time datetime64
+    values, equivalent to datetime.fromtimestamp(x) for each value. The UTC
+    offset is looked up once per hour of data rather than once per sample.
+
+    Parameter
+    ---------
+    seconds : array-like of numerics
+        Linux timestamps in seconds
+
+    Returns
+    -------
+    timestamps : numpy array
+        datetime64[ns] array in local time (microsecond resolution)
+    """
+    seconds = np.asarray(seconds, dtype=np.float64)
+    timestamps = np.empty(seconds.shape, dtype='datetime64[ns]')
+    timestamps[:] = np.datetime64('NaT')
+    valid = np.isfinite(seconds)
+    if not valid.any():
+        return(timestamps)
+    hours, hour_index = np.unique(np.floor(seconds[valid] / 3600).astype(
+                        np.int64), return_inverse=True)
+    offsets = np.array([int((datetime.fromtimestamp(h * 3600) -
+              datetime.fromtimestamp(h * 3600, timezone.utc).replace(tzinfo=
+              None)).total_seconds()) for h in hours], dtype=np.int64)
+    microseconds = np.round(seconds[valid] * 1e6).astype(np.int64) + offsets[
+                   hour_index.ravel()] * 1000000
+    timestamps[valid] = microseconds.astype('datetime64[us]')
+    return(timestamps)
+
 def datetimeint(x, dt_format='%Y-%m-%d %H:%M:%S:%f'):
     """
     Function to turn a datetime string into an datetime formatted as
@@ -656,6 +1536,48 @@ def datetimeint(x, dt_format='%Y-%m-%d %H:%M:%S:%f'):
             return(datetime.strptime(x, "%Y-%m-%d %H:%M:%S.%f").strftime(
                    "%Y-%m-%d %H:%M:%S.%f"))
 
+def datetimearray(x, dt_format='%Y-%m-%d %H:%M:%S:%f'):
+    """
+    Function to turn a column of datetime strings into a datetime64 array in
+    one vectorized pass. Applies the same rules as datetimeint(x, dt_format)
+    to every value: numeric values are Linux timestamps (with the +4h GMT/EST
+    correction, truncated to milliseconds), then `dt_format` is tried, then
+    "%Y-%m-%d %H:%M:%S.%f".
+
+    Parameters
+    ----------
+    x : array-like of strings
+       datetime strings
+
+    dt_format : string
+       datetime format (default='%Y-%m-%d %H:%M:%S:%f')
+
+    Returns
+    -------
+    timestamps : numpy array
+        datetime64[ns] array, one value per input value
+    """
+    x = pd.Series(np.asarray(x, dtype=object))
+    numeric = pd.to_numeric(x, errors='coerce').values.astype(np.float64)
+    is_numeric = ~np.isnan(numeric)
+    timestamps = np.empty(len(x), dtype='datetime64[ns]')
+    if is_numeric.any():
+        # recalibrated from R, this block will unconfuse GMT/EST
+        timestamps[is_numeric] = (fromtimestamp_array(numeric[is_numeric]) +
+                                 np.timedelta64(4, 'h')).astype(
+                                 'datetime64[ms]')
+    if not is_numeric.all():
+        strings = x[~is_numeric].astype(str).str.strip()
+        parsed = pd.to_datetime(strings, format=dt_format, errors='coerce'
+                 ).values.astype('datetime64[ns]')
+        missing = np.isnat(parsed)
+        if missing.any():
+            parsed[missing] = pd.to_datetime(strings[missing], format=
+                              "%Y-%m-%d %H:%M:%S.%f").values.astype(
+                              'datetime64[ns]')
+        timestamps[~is_numeric] = parsed
+    return(timestamps)
+
 def drop_non_csv(open_csv_file, drop_rows, header_row=False):
     """
     Function to read a csv file into a pandas dataframe dropping a specified
@@ -663,8 +1585,8 @@ def drop_non_csv(open_csv_file, drop_rows, header_row=False):
 
     Parameters
     ----------
-    open_csv_file : open csv file
-        an open csv file
+    open_csv_file : open csv file or string
+        an open csv file or the path to one
 
     drop_rows : int
         number of rows to drop
@@ -675,16 +1597,66 @@ def drop_non_csv(open_csv_file, drop_rows, header_row=False):
     Returns
     -------
     df : pandas dataframe
-        a pandas dataframe without the dropped top rows
-    """
-    header = None
-    for x in range(0, drop_rows):
-        open_csv_file.readline()
-    if header_row:
-        header = open_csv_file.readline().split(',')
-    lines = open_csv_file.readlines()
-    df = pd.DataFrame([sub.split(',') for sub in lines], columns=header)
-    return(df)
+        a typed pandas dataframe without the dropped top rows
+    """
+    return(pd.concat(drop_non_csv_chunks(open_csv_file, drop_rows,
+           header_row), ignore_index=True))
+
+def drop_non_csv_chunks(open_csv_file, drop_rows, header_row=False,
+                        chunk_rows=None):
+    """
+    Function to stream a csv file as typed pandas dataframes through the C
+    csv parser, dropping a specified number of rows first. Memory use is
+    bounded by `chunk_rows` regardless of file size.
+
+    Parameters
+    ----------
+    open_csv_file : open csv file or string
+        an open csv file or the path to one
+
+    drop_rows : int
+        number of rows to drop (10 for Actigraph, 100 for GENEActiv)
+
+    header_row : boolean
+        Does csv contain a header after dropped rows? (default=False)
+
+    chunk_rows : int or None
+        maximum rows per chunk (default=None, i.e. `csv_chunk_rows`)
+
+    Returns
+    -------
+    chunks : iterator of pandas dataframes
+        typed dataframes without the dropped top rows
+    """
+    return(pd.read_csv(open_csv_file, skiprows=drop_rows, header=0 if
+           header_row else None, engine='c', chunksize=chunk_rows if
+           chunk_rows else csv_chunk_rows))
+
+def organize_chunks(chunks, organize, chunk_rows=None):
+    """
+    Function to apply a per-chunk organizing function to streamed chunks.
+
+    Parameters
+    ----------
+    chunks : iterator of pandas dataframes
+        typed chunks from drop_non_csv_chunks()
+
+    organize : function
+        function taking one chunk and returning an organized dataframe
+
+    chunk_rows : int or None
+        if given, return a generator of organized chunks; otherwise return
+        one combined dataframe (default=None)
+
+    Returns
+    -------
+    organized : pandas dataframe or generator of pandas dataframes
+        organized data
+    """
+    organized = (organize(chunk) for chunk in chunks)
+    if chunk_rows:
+        return(organized)
+    return(pd.concat(list(organized)))
 
 def main():
     pass
@@ -719,7 +1691,7 @@ def main():
     #e4_1c(e4_dir, 'TEMP')
     #geneactiv_1c(geneactiv_dir, 6)
 
-def save_df(df, sensor, device):
+def save_df(df, sensor, device, file_format=None):
     """
     Function to save formatted dataframe to csv in organized_dir (defined in
     config.py).
@@ -735,29 +1707,308 @@ def save_df(df, sensor, device):
     device : string
         device data is from
 
+    file_format : string or None
+        'csv', 'parquet', 'feather', 'npz' or 'store' (default=None, i.e.
+        `organized_format`); the columnar formats store timestamps as
+        datetime64 / int64 and float columns as float32, and 'store' writes
+        a memory-mapped store directory (see store_data.py)
+
     Outputs
     -------
     csv file
         comma-separated-values file with Linux time-series index column and
         sensor-specific value columns, stored in `organized_dir`/`sensor`/
-        `device`.csv
+        `device`.csv (or `device`.parquet, `device`.feather, `device`.npz,
+        `device`.store)
 
     Returns
     -------
     df : pandas dataframe
         unmodified dataframe
     """
+    file_format = file_format if file_format else organized_format
+    print(''.join(['Saving formatted ', sensor, ' data from ', device]))
+    path = organized_path(sensor, device, file_format)
+    if file_format == 'csv':
+        df.to_csv(path)
+    elif file_format == 'parquet':
+        typed_df(df).to_parquet(path, compression='snappy')
+    elif file_format == 'feather':
+        typed_df(df).to_feather(path)
+    elif file_format == 'npz':
+        typed = typed_df(df)
+        arrays = {c: typed[c].values for c in typed.columns}
+        arrays['Timestamp'] = arrays['Timestamp'].view(np.int64)
+        np.savez_compressed(path, **arrays)
+    elif file_format == 'store':
+        write_store(df, path)
+    else:
+        raise ValueError("Unknown organized file format: {0}".format(
+                         file_format))
+    print("Saved.")
+    return(df)
+
+def typed_df(df):
+    """
+    Function to prepare an organized dataframe for a typed columnar format:
+    the time-series index becomes a datetime64[ns] 'Timestamp' column and
+    float columns become float32.
+
+    Parameters
+    ----------
+    df : pandas dataframe
+        dataframe with Linux time-series index
+
+    Returns
+    -------
+    typed : pandas dataframe
+        new dataframe with a default integer index
+    """
+    typed = df.reset_index()
+    if 'Timestamp' in typed.columns:
+        typed['Timestamp'] = pd.to_datetime(typed['Timestamp']).values.astype(
+                             'datetime64[ns]')
+    for column in typed.columns:
+        if typed[column].dtype == np.float64:
+            typed[column] = typed[column].astype(np.float32)
+    return(typed)
+
+def load_df(data_file, columns=None, file_format=None, start=None,
+            stop=None):
+    """
+    Function to load an organized data file saved by save_df() in any of its
+    formats. With `start` or `stop`, only that time range is read where the
+    format allows: store and csv files are binary searched by timestamp and
+    csv reading stops at the first chunk past `stop`; parquet row groups
+    outside the range are skipped.
+
+    Parameters
+    ----------
+    data_file : string
+        path to organized data file or store directory
+
+    columns : list of strings or None
+        value columns to load; 'Timestamp' is always loaded (default=None,
+        i.e. all columns)
+
+    file_format : string or None
+        'csv', 'parquet', 'feather', 'npz' or 'store' (default=None, i.e.
+        from the file extension, or from the file's first bytes for
+        downloads without one)
+
+    start : datetime-like or None
+        first time to load (default=None, i.e. from the beginning)
+
+    stop : datetime-like or None
+        last time to load (default=None, i.e. to the end)
+
+    Returns
+    -------
+    df : pandas dataframe
+        dataframe with a datetime64 'Timestamp' column and value columns
+    """
+    file_format = file_format if file_format else organized_file_format(
+                  data_file)
+    usecols = ['Timestamp'] + [c for c in columns if c != 'Timestamp'] if \
+              columns else None
+    start = pd.Timestamp(start) if start is not None else None
+    stop = pd.Timestamp(stop) if stop is not None else None
+    if file_format == 'store':
+        return(load_store(data_file, start, stop, columns))
+    if file_format == 'parquet':
+        filters = ([('Timestamp', '>=', start)] if start is not None else []) + \
+                  ([('Timestamp', '<=', stop)] if stop is not None else [])
+        return(pd.read_parquet(data_file, columns=usecols, filters=filters if
+               filters else None).reset_index(drop=True))
+    if file_format == 'feather':
+        return(time_range(pd.read_feather(data_file, columns=usecols), start,
+               stop))
+    if file_format == 'npz':
+        with np.load(data_file) as arrays:
+            ns = arrays['Timestamp']
+            first = np.searchsorted(ns, start.value) if start is not None else 0
+            last = np.searchsorted(ns, stop.value, side='right') if stop is \
+                   not None else len(ns)
+            df = pd.DataFrame({c: ns[first:last] if c == 'Timestamp' else
+                 arrays[c][first:last] for c in (usecols if usecols else
+                 arrays.files)})
+        df['Timestamp'] = df['Timestamp'].values.view('datetime64[ns]')
+        return(df)
+    if start is None and stop is None:
+        return(pd.read_csv(data_file, usecols=usecols, parse_dates=[
+               'Timestamp']))
+    return(load_csv_range(data_file, usecols, start, stop))
+
+def load_csv_range(csv_file, usecols=None, start=None, stop=None,
+                   chunk_rows=100000):
+    """
+    Function to load a time range from a time-ordered organized csv file,
+    reading only the bytes around the range: the first row at or after
+    `start` is found by binary search over byte offsets, and reading stops
+    with the first chunk past `stop`.
+
+    Parameters
+    ----------
+    csv_file : string
+        path to organized csv file with 'Timestamp' as its first column
+
+    usecols : list of strings or None
+        columns to parse (default=None, i.e. all columns)
+
+    start : pandas Timestamp or None
+        first time to load (default=None, i.e. from the beginning)
+
+    stop : pandas Timestamp or None
+        last time to load (default=None, i.e. to the end)
+
+    chunk_rows : int
+        rows to parse at a time, i.e. at most how far past `stop` is parsed
+        (default=100000)
+
+    Returns
+    -------
+    df : pandas dataframe
+        dataframe with a datetime64 'Timestamp' column and value columns
+    """
+    with open(csv_file, 'rb') as fp:
+        names = fp.readline().decode('utf-8').strip().split(',')
+        if names[0] != 'Timestamp':
+            return(time_range(pd.read_csv(csv_file, usecols=usecols,
+                   parse_dates=['Timestamp']), start, stop))
+        if start is not None:
+            fp.seek(csv_time_offset(fp, start))
+        parts = []
+        for chunk in pd.read_csv(fp, header=None, names=names, usecols=usecols,
+                     parse_dates=['Timestamp'], engine='c', chunksize=
+                     chunk_rows):
+            parts.append(time_range(chunk, start, stop))
+            if stop is not None and len(chunk) and chunk['Timestamp'].iloc[
+               -1] > stop:
+                break
+    if not parts:
+        return(pd.DataFrame(columns=usecols if usecols else names))
+    return(pd.concat(parts, ignore_index=True))
+
+def csv_time_offset(open_csv, start, scan_bytes=65536):
+    """
+    Function to find, by binary search over byte offsets, a line boundary in
+    a time-ordered csv file at or before the first row at or after `start`.
+
+    Parameters
+    ----------
+    open_csv : open binary file
+        csv file opened with mode 'rb', positioned after its header line,
+        with timestamps in its first column
+
+    start : pandas Timestamp
+        time to find
+
+    scan_bytes : int
+        stop searching when the range is this narrow (default=65536)
+
+    Returns
+    -------
+    offset : int
+        byte offset of a line start; every row before it is before `start`
+    """
+    low = open_csv.tell()
+    high = os.fstat(open_csv.fileno()).st_size
+    while high - low > scan_bytes:
+        middle = (low + high) // 2
+        open_csv.seek(middle)
+        open_csv.readline()
+        position = open_csv.tell()
+        line = open_csv.readline()
+        if line.strip() and pd.Timestamp(line.split(b',', 1)[0].decode(
+           'utf-8')) < start:
+            low = position
+        else:
+            high = middle
+    return(low)
+
+def time_range(df, start=None, stop=None):
+    """
+    Function to keep the rows of a loaded organized dataframe from `start`
+    to `stop` inclusive.
+
+    Parameters
+    ----------
+    df : pandas dataframe
+        dataframe with 'Timestamp' column
+
+    start : datetime-like or None
+        first time to keep (default=None)
+
+    stop : datetime-like or None
+        last time to keep (default=None)
+
+    Returns
+    -------
+    df : pandas dataframe
+        rows in range
+    """
+    if start is not None:
+        df = df.loc[df['Timestamp'] >= start]
+    if stop is not None:
+        df = df.loc[df['Timestamp'] <= stop]
+    return(df)
+
+def organized_file_format(data_file):
+    """
+    Function to identify the format of an organized data file.
+
+    Parameters
+    ----------
+    data_file : string
+        path to organized data file
+
+    Returns
+    -------
+    file_format : string
+        'csv', 'parquet', 'feather', 'npz' or 'store'
+    """
+    if os.path.isdir(data_file):
+        return('store')
+    extension = os.path.splitext(data_file)[1].lstrip('.').lower()
+    if extension in ['csv', 'parquet', 'feather', 'npz']:
+        return(extension)
+    with open(data_file, 'rb') as fp:
+        magic = fp.read(6)
+    if magic.startswith(b'PAR1'):
+        return('parquet')
+    if magic.startswith(b'ARROW1'):
+        return('feather')
+    if magic.startswith(b'PK'):
+        return('npz')
+    return('csv')
+
+def organized_path(sensor, device, extension='csv'):
+    """
+    Function to get the path of an organized data file, creating
+    `organized_dir`/`sensor` if needed.
+
+    Parameters
+    ----------
+    sensor : string
+        sensor for which the file holds data
+
+    device : string
+        device the data are from
+
+    extension : string
+        file extension (default='csv')
+
+    Returns
+    -------
+    path : string
+        `organized_dir`/`sensor`/`device`.`extension`
+    """
     organized_dir = os.path.abspath(os.path.join(os.getcwd(), os.pardir,
                 "organized"))
-    if not os.path.exists(organized_dir):
-        os.makedirs(organized_dir)
     out_dir = os.path.join(organized_dir, sensor)
     if not os.path.exists(out_dir):
         os.makedirs(out_dir)
-    print(''.join(['Saving formatted ', sensor, ' data from ', device]))
-    df.to_csv(os.path.join(out_dir, '.'.join([device, 'csv'])))
-    print("Saved.")
-    return(df)
+    return(os.path.join(out_dir, '.'.join([device, extension])))
 
 # ============================================================================
 if __name__ == '__main__':
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+read_geneactiv_bin.py
+
+Functions to read raw GENEActiv .bin files directly into typed arrays,
+without a round trip through GENEAread::read.bin and csv.
+
+A .bin file is a text header of "key:value" lines followed by pages of 10
+lines each: "Recorded Data", 8 page header lines (including "Page Time",
+"Temperature" and "Measurement Frequency") and one line of hexadecimal
+sample data. Each sample is 12 hex digits (48 bits): 12-bit signed x, y and
+z, 10-bit light, 1-bit button and 1 reserved bit. Accelerometer values are
+converted to g as (raw × 100 - offset) / gain and light to lux as raw × lux /
+volts, with the gains, offsets, lux and volts from the file header.
+
+@author: jon.clucas
+"""
+from itertools import islice
+import numpy as np, pandas as pd
+axes = ['x', 'y', 'z']
+# lines per page, samples per page
+page_lines = 10
+page_samples = 300
+# ASCII code to hexadecimal digit value
+hex_digits = np.zeros(256, dtype=np.int32)
+for i, c in enumerate(b'0123456789ABCDEF'):
+    hex_digits[c] = i
+for i, c in enumerate(b'abcdef'):
+    hex_digits[c] = i + 10
+
+def main():
+    pass
+
+def read_bin(bin_file, pages_per_chunk=None):
+    """
+    Function to read a GENEActiv .bin file into a dataframe with Linux time-
+    series index column and x, y, z, light, button and temperature value
+    columns.
+
+    Parameters
+    ----------
+    bin_file : string
+        path to GENEActiv .bin file
+
+    pages_per_chunk : int or None
+        if given, stream the file and yield dataframes of this many pages
+        (300 samples each) instead of returning one dataframe (default=None)
+
+    Returns
+    -------
+    df : pandas dataframe or generator of pandas dataframes
+        dataframe with Linux time-series index column; x, y, z in g; light
+        in lux; button (0 or 1) and temperature in °C
+    """
+    chunks = read_bin_chunks(bin_file, pages_per_chunk if pages_per_chunk
+             else 10000)
+    if pages_per_chunk:
+        return(chunks)
+    return(pd.concat(list(chunks)))
+
+def read_bin_chunks(bin_file, pages_per_chunk):
+    """
+    Generator to read a GENEActiv .bin file `pages_per_chunk` pages at a time.
+
+    Parameters
+    ----------
+    bin_file : string
+        path to GENEActiv .bin file
+
+    pages_per_chunk : int
+        pages to decode per dataframe
+
+    Yields
+    ------
+    df : pandas dataframe
+        see read_bin()
+    """
+    with open(bin_file, 'rb') as fp:
+        header = read_bin_header(fp)
+        while True:
+            lines = list(islice(fp, page_lines * pages_per_chunk))
+            if len(lines) < page_lines:
+                return
+            yield(decode_pages(lines[:len(lines) - len(lines) % page_lines],
+                  header))
+
+def read_bin_header(open_bin):
+    """
+    Function to read the file header of an open GENEActiv .bin file, leaving
+    the file positioned at the first page.
+
+    Parameters
+    ----------
+    open_bin : open binary file
+        GENEActiv .bin file opened with mode 'rb'
+
+    Returns
+    -------
+    header : dictionary
+        header values by key (e.g. header['x gain']); 'calibration' holds
+        numpy arrays 'gain' and 'offset' (x, y, z) and floats 'lux' and
+        'volts'
+    """
+    header = {}
+    while True:
+        position = open_bin.tell()
+        line = open_bin.readline()
+        if not line:
+            break
+        line = line.decode('latin-1').strip()
+        if line == 'Recorded Data':
+            open_bin.seek(position)
+            break
+        if ':' in line:
+            key, value = line.split(':', 1)
+            header[key.strip()] = value.strip()
+    header['calibration'] = {'gain': np.array([float(header[' '.join([axis,
+                             'gain'])]) for axis in axes]), 'offset':
+                             np.array([float(header[' '.join([axis,
+                             'offset'])]) for axis in axes]), 'lux': float(
+                             header['Lux']), 'volts': float(header['Volts'])}
+    return(header)
+
+def decode_pages(lines, header):
+    """
+    Function to decode whole pages of a GENEActiv .bin file in bulk.
+
+    Parameters
+    ----------
+    lines : list of bytes
+        page lines, a multiple of 10 long
+
+    header : dictionary
+        file header from read_bin_header()
+
+    Returns
+    -------
+    df : pandas dataframe
+        see read_bin()
+    """
+    pages = len(lines) // page_lines
+    page_info = [dict(line.decode('latin-1').strip().split(':', 1) for line in
+                 lines[p * page_lines + 1:(p + 1) * page_lines - 1] if b':' in
+                 line) for p in range(pages)]
+    data = b''.join(line.strip() for line in lines[page_lines - 1::
+           page_lines])
+    digits = hex_digits[np.frombuffer(data, dtype=np.uint8)].reshape(-1, 12)
+    words = (digits[:, 0::3] << 8) | (digits[:, 1::3] << 4) | digits[:, 2::3]
+    raw = words[:, :3]
+    raw = np.where(raw >= 2048, raw - 4096, raw)
+    calibration = header['calibration']
+    values = (raw * 100 - calibration['offset']) / calibration['gain']
+    frequency = np.array([float(info['Measurement Frequency'].split()[0]) for
+                info in page_info])
+    page_time = pd.to_datetime(pd.Series([info['Page Time'] for info in
+                page_info]), format='%Y-%m-%d %H:%M:%S:%f').values.astype(
+                'datetime64[ns]').view(np.int64)
+    samples = np.arange(page_samples)
+    timestamps = (page_time[:, None] + np.round(samples[None, :] * 1e9 /
+                 frequency[:, None]).astype(np.int64)).ravel()
+    df = pd.DataFrame(values.astype(np.float32), columns=axes, index=
+         pd.Index(timestamps.view('datetime64[ns]'), name='Timestamp'))
+    df['light'] = np.floor((words[:, 3] >> 2) * calibration['lux'] /
+                  calibration['volts']).astype(np.float32)
+    df['button'] = ((words[:, 3] >> 1) & 1).astype(np.int8)
+    df['temperature'] = np.repeat(np.array([float(info['Temperature']) for
+                        info in page_info], dtype=np.float32), page_samples)
+    return(df)
+
+# ============================================================================
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+store_data.py
+
+Functions to store organized data from wearable devices in a time-indexed,
+memory-mapped layout and to query time ranges from it without reading whole
+files.
+
+A store is a directory holding Timestamp.npy (sorted int64 nanoseconds since
+the Linux epoch), one .npy file of values per column, and store.json
+(columns, row count, time range and source). Arrays are opened memory-mapped,
+so a range query binary searches the timestamps and returns views that only
+page in the rows asked for.
+
+@author: jon.clucas
+"""
+import json, numpy as np, os, pandas as pd, shutil
+
+def main():
+    pass
+
+def write_store(df, store_dir, source=None):
+    """
+    Function to write an organized dataframe to a store, replacing any store
+    already at `store_dir` only once the new one is complete.
+
+    Parameters
+    ----------
+    df : pandas dataframe
+        dataframe with Linux time-series index or 'Timestamp' column and
+        numeric value columns
+
+    store_dir : string
+        path to store directory
+
+    source : string or None
+        where the data came from (e.g. a URL), recorded in store.json to tell
+        when the store is out of date (default=None)
+
+    Outputs
+    -------
+    store directory
+        Timestamp.npy, `column`.npy for each value column, and store.json
+
+    Returns
+    -------
+    store_dir : string
+        path to store directory
+    """
+    if 'Timestamp' in df.columns:
+        df = df.set_index('Timestamp')
+    ns = pd.DatetimeIndex(df.index).values.astype('datetime64[ns]').view(
+         np.int64)
+    order = None if np.all(ns[1:] >= ns[:-1]) else np.argsort(ns, kind=
+            'mergesort')
+    temp_dir = ''.join([store_dir.rstrip(os.sep), '.tmp'])
+    if os.path.exists(temp_dir):
+        shutil.rmtree(temp_dir)
+    os.makedirs(temp_dir)
+    np.save(os.path.join(temp_dir, 'Timestamp.npy'), ns if order is None else
+            ns[order])
+    columns = [str(c) for c in df.columns]
+    for column, name in zip(df.columns, columns):
+        values = df[column].values
+        values = values.astype(np.float32) if values.dtype == np.float64 else \
+                 values
+        np.save(os.path.join(temp_dir, '.'.join([name, 'npy'])), values if
+                order is None else values[order])
+    with open(os.path.join(temp_dir, 'store.json'), 'w') as fp:
+        json.dump({'columns': columns, 'rows': len(ns), 'start': str(ns.min(
+                  ).view('datetime64[ns]')) if len(ns) else None, 'stop': str(
+                  ns.max().view('datetime64[ns]')) if len(ns) else None,
+                  'source': source}, fp, indent=2)
+    if os.path.exists(store_dir):
+        shutil.rmtree(store_dir)
+    os.rename(temp_dir, store_dir)
+    return(store_dir)
+
+def store_meta(store_dir):
+    """
+    Function to read a store's store.json.
+
+    Parameters
+    ----------
+    store_dir : string
+        path to store directory
+
+    Returns
+    -------
+    meta : dictionary or None
+        'columns', 'rows', 'start', 'stop' and 'source', or None if there is
+        no complete store at `store_dir`
+    """
+    meta_file = os.path.join(store_dir, 'store.json')
+    if not os.path.exists(meta_file):
+        return(None)
+    with open(meta_file) as fp:
+        return(json.load(fp))
+
+def store_range(store_dir, start=None, stop=None, columns=None):
+    """
+    Function to get the rows of a store from `start` to `stop` inclusive as
+    zero-copy views of the memory-mapped arrays.
+
+    Parameters
+    ----------
+    store_dir : string
+        path to store directory
+
+    start : datetime-like or None
+        first time to include (default=None, i.e. from the beginning)
+
+    stop : datetime-like or None
+        last time to include (default=None, i.e. to the end)
+
+    columns : list of strings or None
+        value columns to get (default=None, i.e. all columns)
+
+    Returns
+    -------
+    arrays : dictionary
+        'Timestamp' (int64 nanoseconds) and value arrays by column, each a
+        read-only view into the store files
+    """
+    columns = columns if columns else store_meta(store_dir)['columns']
+    ns = np.load(os.path.join(store_dir, 'Timestamp.npy'), mmap_mode='r')
+    first = np.searchsorted(ns, pd.Timestamp(start).value, side='left') if \
+            start is not None else 0
+    last = np.searchsorted(ns, pd.Timestamp(stop).value, side='right') if \
+           stop is not None else len(ns)
+    arrays = {'Timestamp': ns[first:last]}
+    for column in columns:
+        if column != 'Timestamp':
+            arrays[column] = np.load(os.path.join(store_dir, '.'.join([column,
+                             'npy'])), mmap_mode='r')[first:last]
+    return(arrays)
+
+def load_store(store_dir, start=None, stop=None, columns=None):
+    """
+    Function to load the rows of a store from `start` to `stop` inclusive
+    into a dataframe shaped like organize_wearable_data.load_df() output.
+
+    Parameters
+    ----------
+    store_dir : string
+        path to store directory
+
+    start : datetime-like or None
+        first time to include (default=None, i.e. from the beginning)
+
+    stop : datetime-like or None
+        last time to include (default=None, i.e. to the end)
+
+    columns : list of strings or None
+        value columns to load (default=None, i.e. all columns)
+
+    Returns
+    -------
+    df : pandas dataframe
+        dataframe with a datetime64 'Timestamp' column and value columns
+    """
+    arrays = store_range(store_dir, start, stop, columns)
+    arrays['Timestamp'] = arrays['Timestamp'].view('datetime64[ns]')
+    return(pd.DataFrame(arrays, copy=False))
+
+# ============================================================================
+if __name__ == '__main__':
+    main()